@@ -5,5 +5,5 @@ from celery import Celery
 os.environ.setdefault('CELERY_CONFIG_MODULE',
                       'background.config.dev.CeleryConfig')
 
-app = Celery(__name__)
+app = Celery(__name__, include=['background.tasks'])
 app.config_from_envvar('CELERY_CONFIG_MODULE')
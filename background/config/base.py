@@ -1,2 +1,25 @@
+from kombu import Queue
+
+from ..routing import (CONVERSATION_SHARDS, CONVERSATION_QUEUE, RECEIPTS_QUEUE,
+                       CONVERSATION_PRIORITY, RECEIPTS_PRIORITY)
+
+
 class BaseCeleryConfig:
     timezone = 'Europe/Paris'
+
+    # Tasks only carry compact JSON payloads, never pickled objects.
+    task_serializer = 'json'
+    accept_content = ['json']
+
+    # One queue per conversation shard, see background.routing.
+    # Consume each of them with a single process to keep messages of a sender in order.
+    # Receipts and echoes have their own queue, consumed by a worker of its own (see the Procfile)
+    # so that user messages never wait behind them. Other queues are consumed round-robin.
+    task_default_queue = 'celery'
+    task_queues = ([Queue('celery')] +
+                   [Queue(CONVERSATION_QUEUE.format(i)) for i in range(CONVERSATION_SHARDS)] +
+                   [Queue(RECEIPTS_QUEUE)])
+    # One priority level per lane: a worker consuming both takes conversation messages first.
+    broker_transport_options = {'priority_steps': [CONVERSATION_PRIORITY, RECEIPTS_PRIORITY]}
+    worker_prefetch_multiplier = 1
+    task_acks_late = True
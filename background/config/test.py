@@ -0,0 +1,11 @@
+from .base import BaseCeleryConfig
+
+
+class CeleryTesting(BaseCeleryConfig):
+    """
+    Runs tasks eagerly, in-process, without any Redis instance.
+    """
+    broker_url = 'memory://'
+    result_backend = 'cache+memory://'
+    task_always_eager = True
+    task_eager_propagates = True
@@ -0,0 +1,53 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+from .routing import shard
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedExecutor:
+    """
+    Thread pool running calls for different keys in parallel, and calls for a given key in
+    submission order: every key is pinned to one of the `workers` threads.
+    """
+
+    def __init__(self, workers: int = 8, name: str = 'keyed-executor'):
+        self._queues = [queue.Queue() for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._work, args=(q,), name='{}-{}'.format(name, i), daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, fn: Callable, *args, **kwargs) -> Future:
+        future = Future()
+        self._queues[shard(key, len(self._queues))].put((future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait: bool = True):
+        for q in self._queues:
+            q.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    @staticmethod
+    def _work(jobs: 'queue.Queue'):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+
+            future, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as exc:
+                logger.exception('Keyed call failed.')
+                future.set_exception(exc)
@@ -0,0 +1,74 @@
+import zlib
+from typing import Any, Dict, List, Optional
+
+from decouple import config, Csv
+
+#: Number of queues conversations are spread over.
+CONVERSATION_SHARDS = config('CELERY_CONVERSATION_SHARDS', cast=int, default=4)
+
+#: Pages with an access token of their own (`PAGE_ACCESS_TOKENS`), whose conversations are keyed by page.
+SCOPED_PAGES = frozenset(pair.split(':', 1)[0] for pair in config('PAGE_ACCESS_TOKENS', cast=Csv(), default=''))
+
+CONVERSATION_QUEUE = 'conversations.{}'
+
+#: Low priority lane: delivery and read receipts, echoes of our own messages, processed in bulk.
+RECEIPTS_QUEUE = 'receipts'
+
+#: Message types of the low priority lane, the others go to their conversation queue.
+BULK_TYPES = frozenset(('delivered', 'read', 'echo'))
+
+#: Task priorities. Redis fetches lower values first, from whichever queue a worker consumes (see `priority_steps`):
+#: conversations all share the same one, so their queues are consumed round-robin and each stays in order.
+CONVERSATION_PRIORITY = 0
+RECEIPTS_PRIORITY = 9
+
+
+def shard(key, shards: int) -> int:
+    # Stable across processes, unlike hash() on strings.
+    return zlib.crc32(str(key).encode()) % shards
+
+
+def conversation_key(sender_id, page_id=None) -> str:
+    """
+    Identifies the conversation of `sender_id` with a page: the same user id may talk to several pages.
+
+    Only the pages of `SCOPED_PAGES` are part of the key: the conversations of the default page keep
+    the key, hence the queue, they had with a single page.
+    """
+    if page_id is None or page_id not in SCOPED_PAGES:
+        return str(sender_id)
+    return '{}:{}'.format(page_id, sender_id)
+
+
+def conversation_queue(sender_id, shards: int = CONVERSATION_SHARDS, page_id=None) -> str:
+    """
+    Queue of the conversation with `sender_id`, on `page_id`.
+
+    All messages of a sender go through the same queue: as long as each queue is consumed
+    by a single worker process (`-c 1`), they are processed in order.
+    """
+    return CONVERSATION_QUEUE.format(shard(conversation_key(sender_id, page_id), shards))
+
+
+def is_bulk(message_type: Optional[str]) -> bool:
+    """
+    Whether messages of `message_type` (a `FacebookMessageType` name) go to the low priority lane, in bulk.
+    """
+    return message_type in BULK_TYPES
+
+
+def route(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `apply_async` options of the task processing `payload`, see `FacebookMessage.to_payload`.
+    """
+    if is_bulk(payload['type']):
+        return route_bulk([payload])
+    return {'queue': conversation_queue(payload['sender'], page_id=payload.get('page')),
+            'priority': CONVERSATION_PRIORITY}
+
+
+def route_bulk(payloads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    `apply_async` options of the task processing several low priority `payloads` at once.
+    """
+    return {'queue': RECEIPTS_QUEUE, 'priority': RECEIPTS_PRIORITY}
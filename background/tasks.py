@@ -0,0 +1,27 @@
+import logging
+
+from facebook.messager import FacebookMessage
+from .app import app
+
+logger = logging.getLogger(__name__)
+
+
+# Bot handlers are imported lazily: web.app enqueues these tasks,
+# so importing web at module level would be circular.
+
+@app.task(ignore_result=True)
+def process_received_message(payload):
+    from web.bot import process_received_message as handler
+    handler(FacebookMessage.from_payload(payload))
+
+
+@app.task(ignore_result=True)
+def process_postback_message(payload):
+    from web.bot import process_postback_message as handler
+    handler(FacebookMessage.from_payload(payload))
+
+
+@app.task(ignore_result=True)
+def process_receipts(payloads):
+    from web.bot import process_receipts as handler
+    handler([FacebookMessage.from_payload(payload) for payload in payloads])
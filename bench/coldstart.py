@@ -0,0 +1,74 @@
+"""
+Measures the cold start of a web worker: time to import the application in a fresh
+interpreter, then to serve its first webhook request.
+
+    python -m bench.coldstart [--runs 10] [--graph-latency 0.2]
+
+The Graph API is a local stand-in answering after `--graph-latency` seconds,
+so that calls made while booting show up in the measurements.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from .fixtures import webhook_bytes
+from .stubs import StubGraphAPI
+from .suite import configure_environment, sign
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import web
+imported = time.perf_counter()
+client = sys.modules['web.app'].app.test_client()
+client.post('/callback', data=sys.argv[1].encode(), headers={'X-Hub-Signature-256': sys.argv[2]})
+served = time.perf_counter()
+print(json.dumps({'import_s': imported - started, 'first_request_s': served - imported}))
+'''
+
+
+def run_once(body: bytes) -> dict:
+    started = time.perf_counter()
+    output = subprocess.check_output([sys.executable, '-c', CHILD, body.decode(), sign(body)],
+                                     env=os.environ.copy())
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result['process_s'] = time.perf_counter() - started
+    return result
+
+
+def summarize(runs: list) -> dict:
+    return {
+        key: {'median': statistics.median(run[key] for run in runs),
+              'min': min(run[key] for run in runs),
+              'max': max(run[key] for run in runs)}
+        for key in runs[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--graph-latency', type=float, default=0.2, help='seconds')
+    args = parser.parse_args()
+
+    body = webhook_bytes(events=3)
+    with StubGraphAPI(args.graph_latency) as graph:
+        configure_environment(graph.url)
+        runs = [run_once(body) for _ in range(args.runs)]
+        calls = sum(graph.stats.values())
+
+    json.dump({
+        'runs': args.runs,
+        'graph_latency_s': args.graph_latency,
+        'graph_calls_per_run': calls / args.runs,
+        'seconds': summarize(runs),
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Stress test of a web worker: `/callback` throughput as gunicorn threads (or greenlets) are added.
+
+    python -m bench.concurrency [--threads 1 2 4 8 16] [--worker-class gthread|gevent]
+                                [--requests 400] [--graph-latency 0.05] [--nlp-latency 0.1]
+
+For each setting, a single gunicorn worker is started with `gunicorn.conf.py`, against stand-ins
+of the Graph API and Recast. Celery tasks run eagerly and the NLP cache is off, so that each request
+waits on both, like a worker answering messages itself. Twice as many requests as threads are
+kept in flight. A JSON report of throughput and latencies per setting is printed, with the
+speedup over the first one.
+"""
+import argparse
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+from .fixtures import PAGE_ID, text_message
+from .replay import LoadGenerator, stub_environment, wait_until_up
+from .stubs import StubGraphAPI, StubRecast
+from .suite import SECRET, configure_environment
+
+
+def text_bodies(senders: int = 50) -> List[Dict[str, Any]]:
+    return [
+        {'object': 'page', 'entry': [{'id': PAGE_ID, 'time': 1500000000000 + i,
+                                      'messaging': [text_message(str(1000000 + i), 1500000000000 + i)]}]}
+        for i in range(senders)
+    ]
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def run(threads: int, worker_class: str, requests: int, environment: Dict[str, str]) -> Dict[str, Any]:
+    bind = '127.0.0.1:{}'.format(free_port())
+    target = 'http://{}/callback'.format(bind)
+    env = dict(os.environ, **environment)
+    env.update({
+        'GUNICORN_WORKER_CLASS': worker_class,
+        'GUNICORN_WORKERS': '1',
+        'GUNICORN_THREADS': str(threads),
+        'GUNICORN_WORKER_CONNECTIONS': str(threads * 4),
+        'GRAPH_POOL_SIZE': str(threads),
+        'NLP_THREADS': str(threads),
+    })
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', bind, 'web:app']
+    process = subprocess.Popen(command, env=env)
+    try:
+        wait_until_up(target, process)
+        generator = LoadGenerator(target, text_bodies(), SECRET, rate=None, concurrency=threads * 2)
+        report = generator.run(requests, None)
+    finally:
+        process.terminate()
+        process.wait()
+
+    report['threads'] = threads
+    report['command'] = ' '.join(shlex.quote(arg) for arg in command)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--worker-class', default='gthread', choices=('gthread', 'gevent'))
+    parser.add_argument('--requests', type=int, default=400, help='per setting')
+    parser.add_argument('--graph-latency', type=float, default=0.05, help='seconds, Graph API stand-in')
+    parser.add_argument('--nlp-latency', type=float, default=0.1, help='seconds, Recast stand-in')
+    args = parser.parse_args()
+
+    with StubGraphAPI(args.graph_latency) as graph, StubRecast(args.nlp_latency) as recast:
+        configure_environment(graph.url)
+        environment = stub_environment(graph, recast, SECRET)
+        environment.update({
+            'NLP_BACKEND': 'recast',
+            'NLP_CACHE_SIZE': '0',
+            'NLP_TIMEOUT': '30',
+            'DEDUPE_WINDOW': '600',
+        })
+
+        results = []
+        for threads in args.threads:
+            results.append(run(threads, args.worker_class, args.requests, environment))
+
+    baseline = results[0]['throughput_rps']
+    for result in results:
+        result['speedup'] = result['throughput_rps'] / baseline if baseline else None
+
+    json.dump({'worker_class': args.worker_class,
+               'graph_latency_s': args.graph_latency,
+               'nlp_latency_s': args.nlp_latency,
+               'results': results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Webhook bodies shaped like the ones Facebook sends us.
+"""
+import json
+from itertools import cycle, islice
+from typing import Any, Dict, List
+
+PAGE_ID = '1234567890'
+
+
+def _event(sender: str, timestamp: int, **kwargs) -> Dict[str, Any]:
+    event = {
+        'sender': {'id': sender},
+        'recipient': {'id': PAGE_ID},
+        'timestamp': timestamp,
+    }
+    event.update(kwargs)
+    return event
+
+
+def text_message(sender: str, timestamp: int, text: str = 'bonjour') -> Dict[str, Any]:
+    return _event(sender, timestamp, message={
+        'mid': 'mid.{}:{}'.format(timestamp, sender),
+        'seq': 73,
+        'text': text,
+    })
+
+
+def quick_reply(sender: str, timestamp: int) -> Dict[str, Any]:
+    return _event(sender, timestamp, message={
+        'mid': 'mid.{}:{}'.format(timestamp, sender),
+        'seq': 74,
+        'text': 'Oui',
+        'quick_reply': {'payload': 'ANSWER_YES'},
+    })
+
+
+def image_message(sender: str, timestamp: int) -> Dict[str, Any]:
+    return _event(sender, timestamp, message={
+        'mid': 'mid.{}:{}'.format(timestamp, sender),
+        'seq': 75,
+        'attachments': [{
+            'type': 'image',
+            'payload': {'url': 'https://scontent.xx.fbcdn.net/v/t34.0-12/{}.png'.format(timestamp)},
+        }],
+    })
+
+
+def location_message(sender: str, timestamp: int) -> Dict[str, Any]:
+    return _event(sender, timestamp, message={
+        'mid': 'mid.{}:{}'.format(timestamp, sender),
+        'seq': 76,
+        'attachments': [{
+            'title': 'Pinned Location',
+            'type': 'location',
+            'payload': {'coordinates': {'lat': 48.8566, 'long': 2.3522}},
+        }],
+    })
+
+
+def echo(sender: str, timestamp: int) -> Dict[str, Any]:
+    return _event(PAGE_ID, timestamp, recipient={'id': sender}, message={
+        'is_echo': True,
+        'app_id': 1517776481860111,
+        'metadata': 'DEVELOPER_DEFINED_METADATA',
+        'mid': 'mid.{}:echo'.format(timestamp),
+        'seq': 77,
+        'text': 'Salut !',
+    })
+
+
+def delivery(sender: str, timestamp: int) -> Dict[str, Any]:
+    return _event(sender, timestamp, delivery={
+        'mids': ['mid.{}:{}'.format(timestamp - 1, sender)],
+        'watermark': timestamp,
+        'seq': 37,
+    })
+
+
+def read(sender: str, timestamp: int) -> Dict[str, Any]:
+    return _event(sender, timestamp, read={
+        'watermark': timestamp,
+        'seq': 38,
+    })
+
+
+def postback(sender: str, timestamp: int) -> Dict[str, Any]:
+    return _event(sender, timestamp, postback={
+        'payload': 'GET_STARTED',
+        'referral': {'ref': 'campaign', 'source': 'SHORTLINK', 'type': 'OPEN_THREAD'},
+    })
+
+
+#: Rough mix of our production traffic: receipts outnumber actual messages.
+TRAFFIC_MIX = (delivery, read, text_message, delivery, read, quick_reply,
+               delivery, read, postback, image_message, echo, location_message)
+
+
+def messaging_events(count: int, senders: int = 100, start: int = 1500000000000) -> List[Dict[str, Any]]:
+    return [
+        factory(str(1000000 + i % senders), start + i)
+        for i, factory in enumerate(islice(cycle(TRAFFIC_MIX), count))
+    ]
+
+
+def webhook_body(events: int = 12, entries: int = 1, senders: int = 100) -> Dict[str, Any]:
+    per_entry = max(1, events // entries)
+    return {
+        'object': 'page',
+        'entry': [
+            {
+                'id': PAGE_ID,
+                'time': 1500000000000 + i,
+                'messaging': messaging_events(per_entry, senders, start=1500000000000 + i * per_entry),
+            }
+            for i in range(entries)
+        ],
+    }
+
+
+def webhook_bytes(events: int = 12, entries: int = 1, senders: int = 100) -> bytes:
+    return json.dumps(webhook_body(events, entries, senders)).encode()
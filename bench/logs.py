@@ -0,0 +1,142 @@
+"""
+Measures the logging overhead of a webhook request, on the request thread.
+
+    python -m bench.logs [--rounds 2000] [--events 12] [--sink-latency 0]
+
+A request logs what `/callback` and its processing log for a webhook body of `--events` events,
+at INFO level, into a file. Configurations:
+
+- `eager_sync`: messages `.format()`ted before the call, written by the request thread (the former setup);
+- `lazy_sync`: deferred formatting, written by the request thread (LOGGING_QUEUE=False);
+- `lazy_queue`: deferred formatting, written by a background thread (the default);
+- `lazy_queue_sampled`: the same, keeping 1% of high-volume records (LOGGING_SAMPLE_RATE=0.01).
+
+`--sink-latency` makes each write take that many seconds, as a slow pipe or log collector would.
+For queued configurations, `drain_us` is the time the writer thread took to catch up, per request.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from logging.handlers import QueueListener
+from typing import Callable, List
+
+from facebook.messager import Messager, FacebookMessage, FacebookMessageType
+from .fixtures import webhook_body
+from .suite import configure_environment
+
+
+class SlowHandler(logging.StreamHandler):
+    def __init__(self, stream, latency: float):
+        super().__init__(stream)
+        self.latency = latency
+
+    def emit(self, record):
+        if self.latency:
+            time.sleep(self.latency)
+        super().emit(record)
+
+
+def eager_request(logger: logging.Logger, messages: List[FacebookMessage]):
+    logger.debug('Loaded {} amount of bytes from request.'.format(4096))
+    logger.debug('Unserialized {} messages.'.format(len(messages)))
+    for message in messages:
+        if message.type != FacebookMessageType.received:
+            logger.warning('Ignored message type: {}'.format(message.type))
+            continue
+        logger.info('Received message: {}'.format(message.text))
+        data = {'recipient': {'id': message.sender.id}, 'message': {'text': 'Bonjour, je suis RyuZU.'}}
+        logger.debug('Message: {}'.format(json.dumps(data)))
+        logger.info("[{status}/{reason}/{text}] Reply to {recipient}: {content}".format(
+            status=200, reason='OK', text='{"recipient_id": "1"}',
+            recipient=data['recipient'], content=data['message']))
+
+
+def lazy_request(logger: logging.Logger, messages: List[FacebookMessage]):
+    logger.debug('Loaded %d amount of bytes from request.', 4096)
+    logger.debug('Unserialized %d messages.', len(messages))
+    for message in messages:
+        if message.type != FacebookMessageType.received:
+            logger.warning('Ignored message type: %s', message.type)
+            continue
+        logger.info('Received message: %s', message.text, extra={'sampled': True})
+        data = {'recipient': {'id': message.sender.id}, 'message': {'text': 'Bonjour, je suis RyuZU.'}}
+        logger.debug('Message: %s', data)
+        logger.info('[%s/%s/%s] Reply to %s: %s', 200, 'OK', '{"recipient_id": "1"}',
+                    data['recipient'], data['message'], extra={'sampled': True})
+
+
+CONFIGURATIONS = OrderedDict([
+    ('eager_sync', (eager_request, False, 1.0)),
+    ('lazy_sync', (lazy_request, False, 1.0)),
+    ('lazy_queue', (lazy_request, True, 1.0)),
+    ('lazy_queue_sampled', (lazy_request, True, 0.01)),
+])
+
+
+def measure(emit: Callable, use_queue: bool, sample_rate: float, messages: List[FacebookMessage],
+            rounds: int, sink_latency: float) -> dict:
+    from web.log import DeferredQueueHandler, SamplingFilter
+
+    with tempfile.TemporaryFile('w') as sink:
+        handler = SlowHandler(sink, sink_latency)
+        handler.setFormatter(logging.Formatter('[%(levelname)s][%(asctime)s] %(module)s: %(message)s'))
+        handler.addFilter(SamplingFilter(sample_rate))
+
+        logger = logging.getLogger('bench.logs.{}'.format(id(handler)))
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+
+        listener = None
+        if use_queue:
+            records = queue.Queue(-1)
+            logger.addHandler(DeferredQueueHandler(records))
+            listener = QueueListener(records, handler, respect_handler_level=True)
+            listener.start()
+        else:
+            logger.addHandler(handler)
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            emit(logger, messages)
+        elapsed = time.perf_counter() - started
+
+        drained = elapsed
+        if listener is not None:
+            listener.stop()  # Returns once every queued record is written.
+            drained = time.perf_counter() - started
+
+        sink.flush()
+        return {
+            'rounds': rounds,
+            'request_thread_us': elapsed / rounds * 1e6,
+            'drain_us': drained / rounds * 1e6,
+            'log_bytes_per_request': os.fstat(sink.fileno()).st_size / rounds,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=12)
+    parser.add_argument('--sink-latency', type=float, default=0.0, help='seconds per written record')
+    args = parser.parse_args()
+
+    configure_environment(graph_url='http://127.0.0.1:9/')  # Importing web.log imports the application.
+    messages = Messager.unserialize_received_request('page', webhook_body(events=args.events))
+    results = OrderedDict(
+        (name, measure(emit, use_queue, sample_rate, messages, args.rounds, args.sink_latency))
+        for name, (emit, use_queue, sample_rate) in CONFIGURATIONS.items()
+    )
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Micro-benchmark of webhook parsing: time and allocations per `entry` batch.
+
+    python -m bench.parse [--events 100] [--rounds 2000]
+"""
+import argparse
+import json
+import timeit
+import tracemalloc
+
+from facebook.messager import Messager
+from .fixtures import webhook_body
+
+
+def measure(events: int, rounds: int, touch: bool) -> dict:
+    body = webhook_body(events)
+
+    def parse():
+        messages = Messager.unserialize_received_request('page', body)
+        if touch:
+            # What the webhook reads on every message.
+            for message in messages:
+                message.type, message.mid, message.sender.id
+        return messages
+
+    parse()
+    seconds = min(timeit.repeat(parse, number=rounds, repeat=5)) / rounds
+
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    kept = parse()
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = snapshot_after.compare_to(snapshot_before, 'filename')
+    del kept
+
+    return {
+        'events': events,
+        'touch': touch,
+        'us_per_batch': seconds * 1e6,
+        'allocated_bytes': sum(stat.size_diff for stat in stats),
+        'allocated_blocks': sum(stat.count_diff for stat in stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=100, help='messaging events per entry batch')
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    for touch in (False, True):
+        print(json.dumps(measure(args.events, args.rounds, touch)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+Replays recorded webhook bodies against `/callback`, at a given rate and concurrency.
+
+    python -m bench.replay --target http://127.0.0.1:8000/callback [--input bodies.jsonl]
+                           [--rate 50] [--concurrency 8] [--requests 1000 | --duration 60]
+                           [--spawn "gunicorn -w 4 -b 127.0.0.1:8000 web:app"]
+                           [--graph-latency 0.05] [--nlp-latency 0.2]
+
+Bodies are read from a JSON lines file, each line being either a webhook body or an object
+holding it under `body`; other lines are skipped. Without input, bodies are generated from
+`bench.fixtures`. Each request is signed with FACEBOOK_SECRET, so ENFORCE_ORIGIN can stay on,
+and gets fresh message ids so that it is not dropped as a redelivery.
+
+With `--spawn`, stand-ins of the Graph API and Recast are started with the given latencies
+and the command is run with its settings pointing to them. `--stubs-only` just runs the
+stand-ins and prints those settings, to start the application and workers by hand.
+
+A JSON report is printed: throughput, latency percentiles and error rate.
+"""
+import argparse
+import copy
+import hashlib
+import hmac
+import json
+import os
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from itertools import count
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+from facebook.throttling import TokenBucket
+from .fixtures import webhook_body
+from .stubs import StubGraphAPI, StubRecast
+
+
+def load_bodies(path: Optional[str]) -> List[Dict[str, Any]]:
+    if path is None:
+        return [webhook_body(events=n) for n in (1, 1, 1, 2, 3, 12)]
+
+    bodies = []
+    with open(path) as records:
+        for line in records:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            if isinstance(record, dict) and isinstance(record.get('body'), str):
+                try:
+                    record = json.loads(record['body'])
+                except ValueError:
+                    continue
+            elif isinstance(record, dict) and 'body' in record:
+                record = record['body']
+
+            if isinstance(record, dict) and record.get('object') == 'page' and 'entry' in record:
+                bodies.append(record)
+
+    return bodies
+
+
+def refresh(body: Dict[str, Any], sequence: int) -> Dict[str, Any]:
+    """
+    Copy of `body` whose messages look new: unique mids and current timestamps.
+    """
+    body = copy.deepcopy(body)
+    now = int(time.time() * 1000)
+    for entry in body['entry']:
+        for offset, event in enumerate(entry.get('messaging', [])):
+            event['timestamp'] = now + offset
+            message = event.get('message')
+            if message and message.get('mid'):
+                message['mid'] = '{}.replay{}'.format(message['mid'], sequence)
+    return body
+
+
+def sign(body: bytes, secret: str) -> str:
+    return 'sha256=' + hmac.new(secret.encode('ascii'), body, hashlib.sha256).hexdigest()
+
+
+def percentile(ordered: List[float], fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class LoadGenerator:
+    def __init__(self, target: str, bodies: List[Dict[str, Any]], secret: str,
+                 rate: Optional[float], concurrency: int, timeout: float = 30.0, fresh_ids: bool = True):
+        self.target = target
+        self.bodies = bodies
+        self.secret = secret
+        self.bucket = TokenBucket(rate, max(1.0, rate / 10)) if rate else None
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.fresh_ids = fresh_ids
+
+        self.latencies = []  # type: List[float]
+        self.outcomes = Counter()
+        self._lock = threading.Lock()
+
+    def _requests(self, total: Optional[int], deadline: Optional[float]) -> Iterator[bytes]:
+        for sequence in count():
+            if total is not None and sequence >= total:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+
+            body = self.bodies[sequence % len(self.bodies)]
+            if self.fresh_ids:
+                body = refresh(body, sequence)
+            yield json.dumps(body).encode()
+
+    def _worker(self, jobs: 'queue.Queue'):
+        session = requests.Session()
+        while True:
+            data = jobs.get()
+            if data is None:
+                return
+
+            if self.bucket is not None:
+                wait = self.bucket.reserve()
+                if wait > 0:
+                    time.sleep(wait)
+
+            started = time.perf_counter()
+            try:
+                response = session.post(self.target, data=data, timeout=self.timeout,
+                                        headers={'Content-Type': 'application/json',
+                                                 'X-Hub-Signature-256': sign(data, self.secret)})
+                outcome = response.status_code
+            except requests.RequestException as exc:
+                outcome = type(exc).__name__
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self.latencies.append(elapsed)
+                self.outcomes[outcome] += 1
+
+    def run(self, total: Optional[int], duration: Optional[float]) -> Dict[str, Any]:
+        jobs = queue.Queue(maxsize=self.concurrency * 2)
+        workers = [threading.Thread(target=self._worker, args=(jobs,), daemon=True)
+                   for _ in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+
+        started = time.monotonic()
+        deadline = started + duration if duration else None
+        for data in self._requests(total, deadline):
+            jobs.put(data)
+        for _ in workers:
+            jobs.put(None)
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        sent = len(ordered)
+        errors = sum(n for outcome, n in self.outcomes.items() if outcome != 200)
+        return {
+            'requests': sent,
+            'elapsed_s': elapsed,
+            'throughput_rps': sent / elapsed if elapsed else None,
+            'error_rate': errors / sent if sent else None,
+            'outcomes': {str(outcome): n for outcome, n in self.outcomes.items()},
+            'latency_ms': {
+                name: value * 1000 if value is not None else None
+                for name, value in (('p50', percentile(ordered, 0.50)),
+                                    ('p90', percentile(ordered, 0.90)),
+                                    ('p99', percentile(ordered, 0.99)),
+                                    ('max', ordered[-1] if ordered else None))
+            },
+        }
+
+
+def stub_environment(graph: StubGraphAPI, recast: StubRecast, secret: str) -> Dict[str, str]:
+    return {
+        'GRAPH_API_URL': graph.url,
+        'RECAST_API_URL': recast.url,
+        'FACEBOOK_SECRET': secret,
+        'ENFORCE_ORIGIN': 'True',
+    }
+
+
+def wait_until_up(target: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The application exited with code {}.'.format(process.returncode))
+        try:
+            requests.get(target, timeout=1.0)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError('The application did not come up within {} seconds.'.format(timeout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', default='http://127.0.0.1:8000/callback')
+    parser.add_argument('--input', help='JSON lines file of recorded webhook bodies')
+    parser.add_argument('--secret', default=os.environ.get('FACEBOOK_SECRET', 'replay-secret'))
+    parser.add_argument('--rate', type=float, help='requests per second, unbounded by default')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, help='number of requests to send')
+    parser.add_argument('--duration', type=float, help='seconds to send requests for')
+    parser.add_argument('--keep-ids', action='store_true', help='replay message ids and timestamps as recorded')
+    parser.add_argument('--spawn', help='command running the application, started against the stand-ins')
+    parser.add_argument('--stubs-only', action='store_true', help='only run the stand-ins')
+    parser.add_argument('--graph-latency', type=float, default=0.05, help='seconds, Graph API stand-in')
+    parser.add_argument('--nlp-latency', type=float, default=0.2, help='seconds, Recast stand-in')
+    args = parser.parse_args()
+
+    if args.requests is None and args.duration is None:
+        args.requests = 1000
+
+    bodies = load_bodies(args.input)
+    if not bodies:
+        parser.error('No webhook body found in {}.'.format(args.input))
+
+    with StubGraphAPI(args.graph_latency) as graph, StubRecast(args.nlp_latency) as recast:
+        environment = stub_environment(graph, recast, args.secret)
+
+        if args.stubs_only:
+            for key, value in environment.items():
+                print('export {}={}'.format(key, shlex.quote(value)))
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return
+
+        process = None
+        if args.spawn:
+            env = dict(os.environ, **environment)
+            env.setdefault('CELERY_CONFIG_MODULE', 'background.config.test.CeleryTesting')
+            process = subprocess.Popen(shlex.split(args.spawn), env=env)
+            wait_until_up(args.target, process)
+
+        try:
+            generator = LoadGenerator(args.target, bodies, args.secret, args.rate, args.concurrency,
+                                      fresh_ids=not args.keep_ids)
+            report = generator.run(args.requests, args.duration)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+        report['bodies'] = len(bodies)
+        report['stubs'] = {
+            'graph_api': {str(status): n for status, n in graph.stats.items()},
+            'recast': {str(status): n for status, n in recast.stats.items()},
+        }
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Local stand-ins for the Graph API, answering like it does after a configurable latency.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubServer:
+    """
+    HTTP server running in a background thread, requests are answered by `respond`.
+    """
+
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.stats = Counter()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body leave in one write, or delayed ACKs add 40ms to each request.
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                status, payload = stub.respond(self.command, urlparse(self.path), body)
+                data = json.dumps(payload).encode()
+                stub.stats[status] += 1
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def respond(self, method: str, url, body: bytes):
+        raise NotImplementedError
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class StubGraphAPI(StubServer):
+    """
+    Accepts every Send API call, answers profile lookups with a dummy profile.
+    """
+
+    def respond(self, method: str, url, body: bytes):
+        if method == 'GET':
+            ids = parse_qs(url.query).get('ids', [''])[0].split(',')
+            return 200, {user_id: {'id': user_id, 'first_name': 'Ryuzu', 'locale': 'fr_FR'} for user_id in ids}
+
+        try:
+            recipient = json.loads(body.decode()).get('recipient', {}).get('id')
+        except (ValueError, AttributeError):
+            recipient = None
+        return 200, {'recipient_id': recipient, 'message_id': 'mid.{}'.format(self.stats[200])}
+
+
+class StubRecast(StubServer):
+    """
+    Answers Recast conversation requests with a canned reply.
+    """
+
+    def respond(self, method: str, url, body: bytes):
+        try:
+            request = json.loads(body.decode())
+        except ValueError:
+            return 400, {'message': 'Malformed request'}
+
+        return 200, {
+            'results': {
+                'uuid': 'stub-{}'.format(self.stats[200]),
+                'source': request.get('text'),
+                'replies': ['Bonjour, je suis RyuZU.'],
+                'action': {'slug': 'greetings', 'done': True, 'reply': 'Bonjour, je suis RyuZU.'},
+                'next_actions': [],
+                'memory': {},
+                'sentiment': 'neutral',
+                'entities': {},
+                'intents': [{'slug': 'greetings', 'confidence': 0.99}],
+                'conversation_token': request.get('conversation_token') or 'stub-conversation',
+                'language': request.get('language', 'fr'),
+                'processing_language': request.get('language', 'fr'),
+                'version': '2.10.1',
+                'timestamp': '2017-07-01T12:00:00.000000+00:00',
+                'status': 200,
+            },
+            'message': 'Converses rendered with success',
+        }
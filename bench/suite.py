@@ -0,0 +1,273 @@
+"""
+Benchmarks of the bot hot paths, results are written as JSON to compare commits.
+
+    python -m bench [--output results.json] [--compare previous.json] [--only NAME ...]
+
+The web application runs against local stand-ins: the Graph API is a stub server,
+the NLP provider is `FakeNLPClient`, and Celery tasks run eagerly.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from collections import OrderedDict
+from typing import Callable, Dict, Any
+
+from .fixtures import webhook_body
+from .stubs import StubGraphAPI
+
+SECRET = 'bench-secret'
+SIGNATURE_HEADER = 'X-Hub-Signature-256'
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(rounds: int):
+    def register(setup: Callable[[Dict[str, Any]], Callable[[], Any]]):
+        BENCHMARKS[setup.__name__] = (setup, rounds)
+        return setup
+    return register
+
+
+def sign(body: bytes, secret: str = SECRET) -> str:
+    return 'sha256=' + hmac.new(secret.encode('ascii'), body, hashlib.sha256).hexdigest()
+
+
+def configure_environment(graph_url: str):
+    """
+    Settings of the web application, to be set before it is imported.
+    """
+    for key, value in (('FACEBOOK_SECRET', SECRET),
+                       ('GREETING_TEXT', 'Bench'),
+                       ('FACEBOOK_VERIFICATION_TOKEN', 'bench'),
+                       ('FACEBOOK_ACCESS_TOKEN', 'bench'),
+                       ('RECAST_AI_TOKEN', 'bench')):
+        os.environ.setdefault(key, value)
+
+    os.environ.update({
+        'GRAPH_API_URL': graph_url,
+        'NLP_BACKEND': 'fake',
+        'ENFORCE_ORIGIN': 'True',
+        'CELERY_CONFIG_MODULE': 'background.config.test.CeleryTesting',
+        # Every request of the benchmark replays the same messages.
+        'DEDUPE_WINDOW': '0',
+        # Measure our own overhead, not the Send API rate limits.
+        'GRAPH_RATE_LIMIT': '1e9',
+        'GRAPH_RATE_BURST': '1e9',
+        'GRAPH_RECIPIENT_RATE_LIMIT': '1e9',
+        'GRAPH_RECIPIENT_RATE_BURST': '1e9',
+        'WEB_LOGGING_LEVEL': 'ERROR',
+        'FACEBOOK_LOGGING_LEVEL': 'ERROR',
+    })
+
+
+def web_app():
+    import web
+    return sys.modules['web.app']
+
+
+@benchmark(rounds=2000)
+def unserialize_received_request(context):
+    from facebook.messager import Messager
+    body = webhook_body(events=12)
+    return lambda: Messager.unserialize_received_request('page', body)
+
+
+@benchmark(rounds=200)
+def unserialize_received_request_100(context):
+    from facebook.messager import Messager
+    body = webhook_body(events=100, entries=4)
+    return lambda: Messager.unserialize_received_request('page', body)
+
+
+@benchmark(rounds=5000)
+def assert_origin_from_facebook(context):
+    import io
+    from web import webhook
+    app = web_app()
+    body = json.dumps(webhook_body(events=12)).encode()
+    headers = {SIGNATURE_HEADER: sign(body)}
+
+    def read_and_verify():
+        app.assert_origin_from_facebook(webhook.read_signed(io.BytesIO(body), headers, len(body),
+                                                            SECRET, app.WEBHOOK_MAX_BODY_SIZE))
+    return read_and_verify
+
+
+@benchmark(rounds=20000)
+def action_button_to_dict(context):
+    from facebook.messager import ActionButton, ButtonType
+    button = ActionButton(ButtonType.WEB_URL, 'Voir le site', url='https://example.com/ryuzu')
+    return button.to_dict
+
+
+@benchmark(rounds=5000)
+def generic_element_to_dict(context):
+    from facebook.messager import ActionButton, ButtonType, GenericElement
+    element = GenericElement('RyuZU', 'Initial-Y Series 01', 'https://example.com/ryuzu.png', [
+        ActionButton(ButtonType.WEB_URL, 'Voir le site', url='https://example.com/ryuzu'),
+        ActionButton(ButtonType.POSTBACK, 'Commencer', payload='GET_STARTED'),
+        ActionButton(ButtonType.POSTBACK, 'Aide', payload='HELP'),
+    ])
+    return element.to_dict
+
+
+@benchmark(rounds=20000)
+def quick_reply_to_dict(context):
+    from facebook.messager import QuickReply
+    reply = QuickReply('Oui', 'ANSWER_YES')
+    return reply.to_dict
+
+
+def carousel(size: int = 5):
+    from facebook.messager import ActionButton, ButtonType, GenericElement
+    return [GenericElement('RyuZU {}'.format(n), 'Initial-Y Series 0{}'.format(n), 'https://example.com/ryuzu.png', [
+        ActionButton(ButtonType.WEB_URL, 'Voir le site', url='https://example.com/ryuzu/{}'.format(n)),
+        ActionButton(ButtonType.POSTBACK, 'Choisir', payload='CHOOSE_{}'.format(n)),
+    ]) for n in range(size)]
+
+
+def quick_replies(size: int = 5):
+    from facebook.messager import QuickReply
+    return [QuickReply('Réponse {}'.format(n), 'ANSWER_{}'.format(n)) for n in range(size)]
+
+
+@benchmark(rounds=10000)
+def generic_payload_dumps(context):
+    from facebook.messager import Messager
+    elements = carousel()
+    return lambda: json.dumps(Messager.build_generic('1000000', elements))
+
+
+@benchmark(rounds=10000)
+def generic_payload_template(context):
+    from facebook.messager import Messager
+    template = Messager.template_generic(carousel())
+    return lambda: Messager._serialize(template.bind('1000000'))
+
+
+@benchmark(rounds=20000)
+def quick_replies_payload_dumps(context):
+    from facebook.messager import Messager
+    replies = quick_replies()
+    return lambda: json.dumps(Messager.build_quick_replies('1000000', 'Alors ?', replies))
+
+
+@benchmark(rounds=20000)
+def quick_replies_payload_template(context):
+    from facebook.messager import Messager
+    template = Messager.template_quick_replies('Alors ?', quick_replies())
+    return lambda: Messager._serialize(template.bind('1000000'))
+
+
+@benchmark(rounds=20000)
+def router_route(context):
+    from facebook.messager import Messager
+    from web.router import Router
+    router = Router()
+    router.payload(*('PAYLOAD_{}'.format(n) for n in range(50)))(print)
+    router.keyword(*('mot clé {}'.format(n) for n in range(200)))(print)
+    router.keyword('aide', 'help', prefix=True)(print)
+    messages = [message for message in Messager.unserialize_received_request('page', webhook_body(events=12))
+                if message.text or message.postback_payload]
+    return lambda: [router.route(message) for message in messages]
+
+
+@benchmark(rounds=300)
+def messager_send(context):
+    from facebook.messager import Messager
+    from facebook.throttling import RateLimiter
+    messager = Messager('bench', graph_url=context['graph'].url,
+                        rate_limiter=RateLimiter(1e9, 1e9, 1e9, 1e9))
+    message = messager.build_text('1000000', 'Bonjour, je suis RyuZU.')
+    return lambda: messager._send(message)
+
+
+@benchmark(rounds=200)
+def callback_post(context):
+    client = web_app().app.test_client()
+    body = json.dumps(webhook_body(events=12)).encode()
+    headers = {SIGNATURE_HEADER: sign(body), 'Content-Type': 'application/json'}
+    return lambda: client.post('/callback', data=body, headers=headers)
+
+
+def measure(fn: Callable[[], Any], rounds: int, repeat: int = 5) -> Dict[str, float]:
+    fn()  # Warm up.
+    timings = [total / rounds for total in timeit.repeat(fn, number=rounds, repeat=repeat)]
+    return {
+        'rounds': rounds,
+        'repeat': repeat,
+        'best_us': min(timings) * 1e6,
+        'median_us': statistics.median(timings) * 1e6,
+        'mean_us': statistics.mean(timings) * 1e6,
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, scale: float = 1.0) -> Dict[str, Any]:
+    results = OrderedDict()
+    with StubGraphAPI() as graph:
+        configure_environment(graph.url)
+        for name, (setup, rounds) in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+
+            context = {'graph': graph, 'cleanups': []}
+            try:
+                results[name] = measure(setup(context), max(1, int(rounds * scale)))
+            finally:
+                for cleanup in reversed(context['cleanups']):
+                    cleanup()
+
+    return {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'results': results,
+    }
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any], output=sys.stderr):
+    print('{:<36} {:>12} {:>12} {:>8}'.format('benchmark', 'before (us)', 'after (us)', 'ratio'), file=output)
+    for name, result in current['results'].items():
+        before = previous['results'].get(name)
+        if before is None:
+            continue
+        print('{:<36} {:>12.2f} {:>12.2f} {:>7.2f}x'.format(
+            name, before['best_us'], result['best_us'], result['best_us'] / before['best_us']), file=output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='write results to this JSON file instead of stdout')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the number of rounds')
+    args = parser.parse_args()
+
+    results = run(args.only, args.scale)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(results, json.load(previous))
@@ -0,0 +1,219 @@
+# -*- coding: utf8 -*-
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict, Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Optional, Set
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+#: Attachment types whose payload is the URL of a file.
+DOWNLOADABLE_TYPES = frozenset(('image', 'audio', 'video', 'file'))
+
+
+class AttachmentTooLarge(ValueError):
+    pass
+
+
+class AttachmentStore:
+    """
+    Local files named after the SHA-256 of their content, at most `max_size` bytes in total:
+    the least recently used ones are deleted first. Files already in `directory` are kept, oldest first.
+    """
+
+    def __init__(self, directory: str, max_size: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.size = 0
+        self.stats = Counter()
+
+        self._entries = OrderedDict()  # type: OrderedDict  # Digest → size, least recently used first.
+        self._urls = {}  # type: Dict[str, str]
+        self._digest_urls = {}  # type: Dict[str, Set[str]]
+        self._lock = threading.Lock()
+
+        os.makedirs(self.temporary_directory, exist_ok=True)
+        self._load()
+
+    @property
+    def temporary_directory(self) -> str:
+        return os.path.join(self.directory, 'tmp')
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _load(self):
+        for leftover in os.listdir(self.temporary_directory):  # Interrupted downloads.
+            os.remove(os.path.join(self.temporary_directory, leftover))
+
+        files = []
+        for prefix in os.listdir(self.directory):
+            folder = os.path.join(self.directory, prefix)
+            if len(prefix) != 2 or not os.path.isdir(folder):
+                continue
+            for digest in os.listdir(folder):
+                info = os.stat(os.path.join(folder, digest))
+                files.append((info.st_mtime, digest, info.st_size))
+        for _, digest, size in sorted(files):
+            self._entries[digest] = size
+            self.size += size
+        self._evict()
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._entries
+
+    def lookup(self, url: str) -> Optional[str]:
+        """
+        Digest of the file downloaded from `url`, if it is still stored.
+        """
+        with self._lock:
+            digest = self._urls.get(url)
+            if digest is None:
+                return None
+            self._entries.move_to_end(digest)
+            return digest
+
+    def put(self, temporary_path: str, digest: str, url: Optional[str] = None) -> str:
+        """
+        Moves a file of `temporary_directory` into the store, unless the same content is already there.
+        """
+        size = os.path.getsize(temporary_path)
+        with self._lock:
+            if digest in self._entries:
+                os.remove(temporary_path)
+                self._entries.move_to_end(digest)
+            else:
+                path = self.path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temporary_path, path)
+                self._entries[digest] = size
+                self.size += size
+            if url is not None:
+                self._urls[url] = digest
+                self._digest_urls.setdefault(digest, set()).add(url)
+            self._evict()
+        return digest
+
+    def _evict(self):
+        # The most recent entry stays, even alone over `max_size`.
+        while self.size > self.max_size and len(self._entries) > 1:
+            digest, size = self._entries.popitem(last=False)
+            self.size -= size
+            for url in self._digest_urls.pop(digest, ()):
+                del self._urls[url]
+            try:
+                os.remove(self.path(digest))
+            except OSError:
+                logger.warning('Could not delete attachment %s.', digest, exc_info=True)
+            self.stats['evictions'] += 1
+
+    @contextmanager
+    def read(self, digest: str):
+        """
+        Read-only memory map of a stored file (bytes when it is empty), valid within the context.
+        Raises KeyError if the file is not stored.
+        """
+        with self._lock:
+            if digest not in self._entries:
+                raise KeyError(digest)
+            self._entries.move_to_end(digest)
+            size = self._entries[digest]
+            attachment = open(self.path(digest), 'rb')
+
+        with attachment:
+            if size == 0:
+                yield b''
+                return
+            with mmap.mmap(attachment.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                yield content
+
+
+class AttachmentFetcher:
+    """
+    Downloads attachments in the background, `concurrency` at a time, into an `AttachmentStore`.
+    Files are streamed to disk by chunks while being hashed; they are never held in memory.
+    """
+
+    def __init__(self, store: AttachmentStore, session: requests.Session = None, concurrency: int = 4,
+                 chunk_size: int = 64 * 1024, max_file_size: int = 25 * 1024 * 1024, timeout: float = 30.0):
+        self.store = store
+        self.chunk_size = chunk_size
+        self.max_file_size = min(max_file_size, store.max_size)
+        self.timeout = timeout
+        self.stats = Counter()
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix='attachments')
+
+        self._pending = {}  # type: Dict[str, Future]
+        self._lock = threading.Lock()
+
+    def fetch(self, url: str) -> Future:
+        """
+        Future of the digest of the file at `url`, downloaded at most once at a time.
+        """
+        digest = self.store.lookup(url)
+        if digest is not None:
+            self.stats['hits'] += 1
+            future = Future()
+            future.set_result(digest)
+            return future
+
+        with self._lock:
+            future = self._pending.get(url)
+            if future is None:
+                future = self._pending[url] = self.executor.submit(self._download, url)
+                future.add_done_callback(lambda _: self._forget(url))
+        return future
+
+    def _forget(self, url: str):
+        with self._lock:
+            self._pending.pop(url, None)
+
+    @contextmanager
+    def open(self, url: str, timeout: Optional[float] = None):
+        """
+        Memory map of the file at `url`, downloaded first if needed. See `AttachmentStore.read`.
+        """
+        digest = self.fetch(url).result(timeout)
+        with self.store.read(digest) as content:
+            yield content
+
+    def _download(self, url: str) -> str:
+        self.stats['downloads'] += 1
+        digest = hashlib.sha256()
+        size = 0
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.store.temporary_directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary, \
+                    self.session.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_file_size:
+                        raise AttachmentTooLarge('Attachment over {} bytes: {}'.format(self.max_file_size, url))
+                    digest.update(chunk)
+                    temporary.write(chunk)
+        except Exception:
+            self.stats['errors'] += 1
+            os.remove(temporary_path)
+            raise
+
+        self.stats['downloaded_bytes'] += size
+        return self.store.put(temporary_path, digest.hexdigest(), url)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
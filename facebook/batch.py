@@ -0,0 +1,160 @@
+# -*- coding: utf8 -*-
+import json
+import logging
+import threading
+from typing import List, Dict, Any, Callable, Optional
+from urllib.parse import urlencode
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+#: Hard limit of the Graph API on the number of requests in one batch.
+MAX_BATCH_SIZE = 50
+
+
+class BatchItem:
+    """
+    Outcome of one message sent through a `MessageBatch`.
+    Filled once the batch holding it has been flushed.
+    """
+
+    def __init__(self, message_data: Dict[str, Any]):
+        self.message_data = message_data
+        self.status_code = None
+        self.body = None
+        self.error = None
+        self.done = threading.Event()
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code is not None and 200 <= self.status_code < 300
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.done.wait(timeout)
+
+    def _resolve(self, status_code: Optional[int], body: Any = None, error: Optional[str] = None):
+        self.status_code = status_code
+        self.body = body
+        self.error = error
+        self.done.set()
+
+
+class MessageBatch:
+    """
+    Gathers outgoing Send API payloads and posts them as Graph API batch requests.
+
+    A batch is flushed when it reaches `max_size` items, when `max_delay` seconds
+    went by since its first item was added, or when leaving the context manager.
+    `on_result`, if given, is called with each `BatchItem` once resolved.
+    """
+
+    def __init__(self, session: requests.Session, graph_url: str, relative_url: str,
+                 max_size: int = MAX_BATCH_SIZE, max_delay: float = 1.0,
+                 on_result: Optional[Callable[[BatchItem], None]] = None):
+        if not 0 < max_size <= MAX_BATCH_SIZE:
+            raise ValueError('Batch size must be between 1 and {}'.format(MAX_BATCH_SIZE))
+
+        self.session = session
+        self.graph_url = graph_url
+        self.relative_url = relative_url
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.on_result = on_result
+
+        self._pending = []  # type: List[BatchItem]
+        self._lock = threading.Lock()
+        self._timer = None  # type: Optional[threading.Timer]
+
+    def __enter__(self) -> 'MessageBatch':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, message_data: Dict[str, Any]) -> BatchItem:
+        item = BatchItem(message_data)
+        with self._lock:
+            self._pending.append(item)
+            full = len(self._pending) >= self.max_size
+            if not full and self._timer is None and self.max_delay is not None:
+                self._timer = threading.Timer(self.max_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if full:
+            self.flush()
+
+        return item
+
+    def flush(self) -> List[BatchItem]:
+        with self._lock:
+            items, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        for start in range(0, len(items), self.max_size):
+            self._post(items[start:start + self.max_size])
+
+        return items
+
+    def close(self) -> List[BatchItem]:
+        return self.flush()
+
+    def _encode(self, item: BatchItem) -> Dict[str, Any]:
+        return {
+            'method': 'POST',
+            'relative_url': self.relative_url,
+            'body': urlencode({key: json.dumps(value) for key, value in item.message_data.items()}),
+        }
+
+    def _post(self, items: List[BatchItem]):
+        if not items:
+            return
+
+        try:
+            req = self.session.post(self.graph_url,
+                                    data=json.dumps({'batch': [self._encode(item) for item in items]}))
+        except requests.RequestException as exc:
+            logger.exception('Batch of %d messages could not be sent.', len(items))
+            for item in items:
+                item._resolve(None, error=str(exc))
+            return self._report(items)
+
+        logger.info('[%s/%s] Sent batch of %d messages.', req.status_code, req.reason, len(items))
+
+        try:
+            responses = req.json() if req.ok else None
+        except ValueError:
+            responses = None
+
+        if not isinstance(responses, list):
+            for item in items:
+                item._resolve(req.status_code, error=req.text)
+            return self._report(items)
+
+        # Responses come back in request order, `null` for the ones which timed out.
+        for item, response in zip(items, responses + [None] * (len(items) - len(responses))):
+            if response is None:
+                item._resolve(None, error='No response for this request.')
+                continue
+
+            try:
+                body = json.loads(response.get('body') or 'null')
+            except ValueError:
+                body = response.get('body')
+
+            error = body.get('error') if isinstance(body, dict) else None
+            item._resolve(response.get('code'), body, error)
+
+        self._report(items)
+
+    def _report(self, items: List[BatchItem]):
+        for item in items:
+            if not item.ok:
+                logger.warning('[%s] Batched reply to %s failed: %s',
+                               item.status_code, item.message_data.get('recipient'), item.error)
+
+            if self.on_result is not None:
+                self.on_result(item)
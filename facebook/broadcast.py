@@ -0,0 +1,128 @@
+# -*- coding: utf8 -*-
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from itertools import islice
+from typing import Any, Dict, Iterable, NamedTuple, Optional, TextIO
+
+logger = logging.getLogger(__name__)
+
+BroadcastReport = NamedTuple('BroadcastReport', [
+    ('sent', int),
+    ('failed', int),
+    ('resumed_from', int),  # Recipients skipped, as already handled by a previous run.
+    ('statuses', Dict[str, int]),  # HTTP status code, or exception name, → count.
+])
+
+
+class FileCheckpoint:
+    """
+    Position in the recipient list up to which a broadcast is done, kept in a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> int:
+        try:
+            with open(self.path) as checkpoint:
+                return int(checkpoint.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def save(self, position: int):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as checkpoint:
+            checkpoint.write(str(position))
+        os.replace(temporary, self.path)
+
+
+class _Progress:
+    """
+    Lowest position before which every recipient is handled, while sends complete out of order.
+    Only positions completed ahead of it are remembered: at most the number of sends in flight.
+    """
+
+    def __init__(self, position: int):
+        self.position = position
+        self._ahead = set()
+
+    def done(self, index: int) -> int:
+        self._ahead.add(index)
+        while self.position in self._ahead:
+            self._ahead.remove(self.position)
+            self.position += 1
+        return self.position
+
+
+def broadcast(messager, recipients: Iterable[Any], template, concurrency: int = 8, checkpoint=None,
+              checkpoint_every: int = 100, log: Optional[TextIO] = None) -> BroadcastReport:
+    """
+    Sends `template` (a `MessageTemplate`) to every recipient id, `concurrency` sends at a time,
+    through the rate limiter and retry policy of `messager`.
+
+    Recipients are consumed lazily, a few at a time, so that memory does not depend on their number.
+    With `checkpoint` (e.g. `FileCheckpoint`), progress is saved every `checkpoint_every` sends and
+    when interrupted: running it again skips the recipients already handled. The sends which were
+    in flight when interrupted may be repeated. With `log`, a `position<TAB>recipient<TAB>status`
+    line is written for each recipient.
+    """
+    start = checkpoint.load() if checkpoint is not None else 0
+    progress = _Progress(start)
+    statuses = Counter()
+    jobs = queue.Queue(maxsize=concurrency * 2)
+    stopping = threading.Event()
+    lock = threading.Lock()
+
+    def send(recipient):
+        try:
+            response = messager._send(template.bind(recipient))
+        except Exception as exc:
+            logger.warning('Broadcast to %s failed.', recipient, exc_info=True)
+            return type(exc).__name__, False
+        return str(response.status_code), response.ok
+
+    def work():
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            if stopping.is_set():
+                continue
+
+            index, recipient = job
+            status, ok = send(recipient)
+            with lock:
+                statuses[status] += 1
+                statuses['ok' if ok else 'failed'] += 1
+                if log is not None:
+                    log.write('{}\t{}\t{}\n'.format(index, recipient, status))
+                position = progress.done(index)
+                if checkpoint is not None and (statuses['ok'] + statuses['failed']) % checkpoint_every == 0:
+                    checkpoint.save(position)
+
+    workers = [threading.Thread(target=work, name='broadcast-{}'.format(n), daemon=True)
+               for n in range(concurrency)]
+    for worker in workers:
+        worker.start()
+
+    completed = False
+    try:
+        for job in enumerate(islice(recipients, start, None), start):
+            jobs.put(job)
+        completed = True
+    finally:
+        if not completed:
+            # Interrupted: the queued recipients are not sent, the checkpoint stays before them.
+            stopping.set()
+        for _ in workers:
+            jobs.put(None)
+        for worker in workers:
+            worker.join()
+        if checkpoint is not None:
+            checkpoint.save(progress.position)
+
+    sent, failed = statuses.pop('ok', 0), statuses.pop('failed', 0)
+    return BroadcastReport(sent, failed, start, dict(statuses))
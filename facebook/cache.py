@@ -0,0 +1,148 @@
+# -*- coding: utf8 -*-
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, Counter
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache, whose entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = Counter()
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.stats['misses'] += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._data[key]
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """
+    Cache shared between processes, values are stored as JSON under `prefix`.
+    Redis failures are logged and treated as misses, the cache is never required.
+    """
+
+    def __init__(self, redis, prefix: str, ttl: float = 3600.0):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stats = Counter()
+
+    def _key(self, key) -> str:
+        return '{}:{}'.format(self.prefix, key)
+
+    def get(self, key, default=None):
+        try:
+            raw = self.redis.get(self._key(key))
+        except Exception:
+            logger.warning('Shared cache unavailable, reading %s.', key, exc_info=True)
+            raw = None
+
+        if raw is None:
+            self.stats['misses'] += 1
+            return default
+
+        self.stats['hits'] += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        try:
+            self.redis.setex(self._key(key), int(self.ttl if ttl is None else ttl), json.dumps(value))
+        except Exception:
+            logger.warning('Shared cache unavailable, writing %s.', key, exc_info=True)
+
+    def delete(self, key):
+        try:
+            self.redis.delete(self._key(key))
+        except Exception:
+            logger.warning('Shared cache unavailable, deleting %s.', key, exc_info=True)
+
+
+class TieredCache:
+    """
+    In-process cache in front of an optional shared one.
+    Shared hits are copied in-process, so that later lookups stay local.
+    """
+
+    def __init__(self, local: TTLCache = None, shared: RedisCache = None):
+        self.local = local if local is not None else TTLCache()
+        self.shared = shared
+
+    @property
+    def stats(self) -> Counter:
+        stats = Counter({'local_' + key: value for key, value in self.local.stats.items()})
+        if self.shared is not None:
+            stats.update({'shared_' + key: value for key, value in self.shared.stats.items()})
+        stats['hits'] = stats['local_hits'] + stats['shared_hits']
+        stats['misses'] = stats['shared_misses'] if self.shared is not None else stats['local_misses']
+        return stats
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        if self.shared is not None:
+            value = self.shared.get(key, _MISSING)
+            if value is not _MISSING:
+                self.local.set(key, value)
+                return value
+
+        return default
+
+    def set(self, key, value: Any):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
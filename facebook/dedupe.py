@@ -0,0 +1,82 @@
+# -*- coding: utf8 -*-
+import logging
+import threading
+from collections import Counter
+from typing import List, Optional
+
+from .cache import TTLCache
+from .messager import FacebookMessage, FacebookMessageType
+
+logger = logging.getLogger(__name__)
+
+
+class SeenSet:
+    """
+    Remembers keys for `window` seconds, at most `maxsize` of them (least recently seen are forgotten first).
+    """
+
+    def __init__(self, window: float = 600.0, maxsize: int = 100000):
+        self.cache = TTLCache(maxsize=maxsize, ttl=window)
+        self._lock = threading.Lock()
+
+    def add(self, key: str) -> bool:
+        """
+        Mark `key` as seen, return whether it was not already.
+        """
+        with self._lock:
+            if self.cache.get(key) is not None:
+                return False
+            self.cache.set(key, True)
+            return True
+
+
+class RedisSeenSet:
+    """
+    Seen set shared between processes, through Redis `SET NX`.
+    When Redis is unavailable, keys are considered as new: better answer twice than never.
+    """
+
+    def __init__(self, redis, prefix: str = 'seen', window: float = 600.0):
+        self.redis = redis
+        self.prefix = prefix
+        self.window = window
+
+    def add(self, key: str) -> bool:
+        try:
+            return bool(self.redis.set('{}:{}'.format(self.prefix, key), 1, nx=True, ex=int(self.window)))
+        except Exception:
+            logger.warning('Shared seen set unavailable, accepting %s.', key, exc_info=True)
+            return True
+
+
+class Deduplicator:
+    """
+    Drops the messages Facebook redelivered, before they get dispatched.
+
+    Messages are identified by their `mid`, postbacks by their sender and timestamp.
+    Receipts are idempotent and always let through.
+    """
+
+    def __init__(self, seen=None):
+        self.seen = seen if seen is not None else SeenSet()
+        self.stats = Counter()
+
+    @staticmethod
+    def key(message: FacebookMessage) -> Optional[str]:
+        if message.mid is not None:
+            return message.mid
+        if message.type == FacebookMessageType.postback:
+            return 'postback:{}:{}'.format(message.sender.id, message.timestamp)
+        return None
+
+    def filter(self, messages: List[FacebookMessage]) -> List[FacebookMessage]:
+        unique = []
+        for message in messages:
+            key = self.key(message)
+            if key is None or self.seen.add(key):
+                unique.append(message)
+                self.stats['unique'] += 1
+            else:
+                logger.debug('Dropped redelivered message %s.', key)
+                self.stats['duplicates'] += 1
+        return unique
@@ -1,10 +1,21 @@
 # -*- coding: utf8 -*-
+import asyncio
 import json
 import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
 from enum import Enum
-from typing import List, Dict, Any, NamedTuple, Optional
+from typing import List, Dict, Any, Iterable, NamedTuple, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from .batch import MessageBatch, MAX_BATCH_SIZE
+from .broadcast import BroadcastReport, broadcast
+from .cache import TieredCache
+from .throttling import RateLimiter, RetryPolicy
 
 __original_author__ = "enginebai"
 
@@ -118,7 +129,7 @@ class QuickReply:
         reply_dict[PAYLOAD_FIELD] = self.payload
         if self.image_url is not None:
             reply_dict[IMAGE_FIELD] = self.image_url
-        logger.debug('Reply dict: {}'.format(reply_dict))
+        logger.debug('Reply dict: %s', reply_dict)
         return reply_dict
 
 
@@ -126,26 +137,57 @@ class FacebookMessageType(Enum):
     received = "message"
     delivered = "delivery"
     read = "read"
-    echo = "message"
+    echo = "message_echoes"
     postback = "postback"
 
 
 def recognize_message_type(message: Dict[str, Any]) -> FacebookMessageType:
-    guess = None
-    for msg_type in FacebookMessageType:
-        if message.get(msg_type.value):
-            guess = msg_type
+    # Direct key lookups, the most frequent events first.
+    if message.get('delivery'):
+        return FacebookMessageType.delivered
+    if message.get('read'):
+        return FacebookMessageType.read
+    if message.get('postback'):
+        return FacebookMessageType.postback
+    if message.get('message'):
+        return FacebookMessageType.echo if message['message'].get('is_echo', False) else FacebookMessageType.received
+    return None
+
+
+_UNSET = object()
+
+
+class _Lazy:
+    """
+    Slot-backed attribute, computed from the raw message on first access only.
+    """
+    __slots__ = ('slot', 'factory')
+
+    def __init__(self, slot: str, factory):
+        self.slot = slot
+        self.factory = factory
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
 
-    if guess in (FacebookMessageType.received, FacebookMessageType.echo):
-        guess = FacebookMessageType.echo if message['message'].get('is_echo', False) else FacebookMessageType.received
+        value = getattr(instance, self.slot)
+        if value is _UNSET:
+            value = self.factory(instance)
+            setattr(instance, self.slot, value)
+        return value
 
-    return guess
+    def __set__(self, instance, value):
+        setattr(instance, self.slot, value)
 
 
 class FacebookEntity:
     USER_FIELDS = ['first_name', 'last_name', 'profile_pic', 'locale',
                    'timezone', 'gender', 'is_payment_enabled', 'last_ad_referral']
 
+    # Fields without a slot of their own (`name`, `email`...) are kept in `extra`, and read as attributes too.
+    __slots__ = ['id', 'extra'] + USER_FIELDS
+
     def __init__(self, user: Dict[str, Any]):
         self.id = user.get('id', None)
 
@@ -158,10 +200,20 @@ class FacebookEntity:
         self.gender = None
         self.is_payment_enabled = None
         self.last_ad_referral = None
+        self.extra = {}
 
     def hydrate_user_from_api(self, data: Dict[str, Any]):
         for key, value in data.items():
-            setattr(self, key, value)  # Question to myself: json.loads should do the job and perform conversion, right?
+            if key in self.__slots__ and key != 'extra':
+                setattr(self, key, value)
+            else:
+                self.extra[key] = value
+
+    def __getattr__(self, name: str):
+        # Only called for names without a value in their slot: `extra` itself may not be set yet, e.g. while unpickling.
+        if name != 'extra' and name in getattr(self, 'extra', ()):
+            return self.extra[name]
+        raise AttributeError('{!r} object has no attribute {!r}'.format(type(self).__name__, name))
 
     def __bool__(self):
         return self.id is not None
@@ -175,6 +227,8 @@ Coordinates = NamedTuple('Coordinates', [
 
 # FIXME: Add support for generic, list, open graph, receipt, airline stuff.
 class FacebookTemplate:
+    __slots__ = ('type', 'buttons')
+
     def __init__(self, template: Dict[str, Any]):
         self.type = template.get('template_type')
         self.buttons = [
@@ -185,6 +239,8 @@ class FacebookTemplate:
 
 
 class FacebookFallback:
+    __slots__ = ('title', 'url', 'payload')
+
     def __init__(self, fallback: Dict[str, Any]):
         self.title = fallback.get('title')
         self.url = fallback.get('url')
@@ -192,13 +248,17 @@ class FacebookFallback:
 
 
 class FacebookAttachment:
+    __slots__ = ('type', 'payload')
+
     def __init__(self, attachment: Dict[str, Any]):
         self.type = attachment['type']
+        self.payload = None
         if self.type in ('image', 'audio', 'video', 'file'):
             self.payload = attachment['payload']['url']
         elif self.type == 'location':
-            self.payload = Coordinates(lat=float(attachment['payload']['lat']),
-                                       long=float(attachment['payload']['long']))
+            coordinates = attachment['payload'].get('coordinates', attachment['payload'])
+            self.payload = Coordinates(lat=float(coordinates['lat']),
+                                       long=float(coordinates['long']))
         elif self.type == 'template':
             self.payload = FacebookTemplate(attachment['payload'])
         elif self.type == 'fallback':
@@ -217,6 +277,8 @@ def recognize_referral_source(referral: Dict[str, Any]) -> FacebookReferralSourc
 
 
 class FacebookPostbackReferral:
+    __slots__ = ('referral_source',)
+
     def __init__(self, referral: Optional[Dict[str, Any]]):
         if referral:
             self.referral_source = recognize_referral_source(referral)
@@ -227,37 +289,63 @@ class FacebookPostbackReferral:
         return self.referral_source is not None
 
 
+def _build_sender(message: 'FacebookMessage') -> FacebookEntity:
+    return FacebookEntity(message._message.get('sender'))
+
+
+def _build_recipient(message: 'FacebookMessage') -> FacebookEntity:
+    return FacebookEntity(message._message.get('recipient'))
+
+
+def _build_attachments(message: 'FacebookMessage') -> List[FacebookAttachment]:
+    if message.type not in (FacebookMessageType.received, FacebookMessageType.echo):
+        return []
+    return [FacebookAttachment(attachment) for attachment in message._message['message'].get('attachments', [])]
+
+
+def _build_referral(message: 'FacebookMessage') -> Optional[FacebookPostbackReferral]:
+    if message.type != FacebookMessageType.postback:
+        return None
+    return FacebookPostbackReferral(message._message['postback'].get('referal'))
+
+
 class FacebookMessage:
-    # Filled when the first instance is created.
+    """
+    A messaging event of a webhook entry.
+
+    Only scalar fields are read when parsing, the sender, recipient, attachments and referral
+    are materialized on first access, as most events (receipts) never need them.
+    """
+    __slots__ = ('type', '_message', 'timestamp', 'page_id',
+                 'mid', 'text', 'quick_reply_payload', 'app_id', 'metadata',
+                 'mids', 'watermark', 'seq', 'postback_payload',
+                 '_sender', '_recipient', '_attachments', '_referral')
+
     DISPATCHERS = {}
-    initialized = False
+
+    sender = _Lazy('_sender', _build_sender)
+    recipient = _Lazy('_recipient', _build_recipient)
+    attachments = _Lazy('_attachments', _build_attachments)
+    referral = _Lazy('_referral', _build_referral)
 
     def __init__(self, message: Dict[str, Any]):
         self.type = recognize_message_type(message)
 
-        if not self.__class__.initialized:
-            self.__class__.DISPATCHERS = {
-                FacebookMessageType.received: FacebookMessage._process_received,
-                FacebookMessageType.delivered: FacebookMessage._process_delivered,
-                FacebookMessageType.read: FacebookMessage._process_read,
-                FacebookMessageType.echo: FacebookMessage._process_echo,
-                FacebookMessageType.postback: FacebookMessage._process_postback,
-            }
-            self.__class__.initialized = True
-            self.DISPATCHERS = self.__class__.DISPATCHERS
-
         self._message = message
-        self.sender = FacebookEntity(message.get('sender'))
-        self.recipient = FacebookEntity(message.get('recipient'))
+        self._sender = _UNSET
+        self._recipient = _UNSET
+        self._attachments = _UNSET
+        self._referral = _UNSET
         self.timestamp = message.get('timestamp')
+        self.page_id = None  # Set from the webhook entry.
 
         # Message / Received.
         self.mid = None
         self.text = None
         self.quick_reply_payload = None
-        self.attachments = []
 
         # Echo
+        self.app_id = None
         self.metadata = None
 
         # Delivered
@@ -267,7 +355,6 @@ class FacebookMessage:
 
         # Postback
         self.postback_payload = None
-        self.referral = None
 
         self.DISPATCHERS[self.type](self)
 
@@ -276,14 +363,14 @@ class FacebookMessage:
         self.mid = message.get('mid')
         self.text = message.get('text')
 
-        self.quick_reply_payload = message.get('quick_reply', {}).get('payload', None)
-        for attachment in message.get('attachments', []):
-            self.attachments.append(FacebookAttachment(attachment))
+        quick_reply = message.get('quick_reply')
+        if quick_reply is not None:
+            self.quick_reply_payload = quick_reply.get('payload')
 
     def _process_delivered(self):
         message = self._message['delivery']
 
-        self.mids.extend(message.get('mids', []))
+        self.mids = message.get('mids', [])
         self.watermark = message['watermark']  # Always present per FB docs.
         self.seq = message.get('seq')
 
@@ -301,17 +388,93 @@ class FacebookMessage:
         self.mid = message.get('mid')
         self.text = message.get('text')
 
-        for attachment in message.get('attachments', []):
-            self.attachments.append(FacebookAttachment(attachment))
-
     def _process_postback(self):
         message = self._message['postback']
 
         self.postback_payload = message['payload']
-        self.referral = FacebookPostbackReferral(message.get('referal'))
+
+    def to_payload(self) -> Dict[str, Any]:
+        """
+        Compact, JSON-serializable form of this message, suitable as a task argument.
+        Only what the parser needs to rebuild the message is kept.
+        """
+        payload = {
+            'type': self.type.name,
+            'sender': self.sender.id,
+            'recipient': self.recipient.id,
+            'timestamp': self.timestamp,
+        }
+        if self.page_id is not None:
+            payload['page'] = self.page_id
+
+        if self.type in (FacebookMessageType.received, FacebookMessageType.echo):
+            message = self._message['message']
+            payload['mid'] = self.mid
+            payload['text'] = self.text
+            if self.quick_reply_payload is not None:
+                payload['quick_reply_payload'] = self.quick_reply_payload
+            if message.get('attachments'):
+                payload['attachments'] = message['attachments']
+        elif self.type == FacebookMessageType.delivered:
+            payload['mids'] = self.mids
+            payload['watermark'] = self.watermark
+            payload['seq'] = self.seq
+        elif self.type == FacebookMessageType.read:
+            payload['watermark'] = self.watermark
+            payload['seq'] = self.seq
+        elif self.type == FacebookMessageType.postback:
+            payload['postback_payload'] = self.postback_payload
+
+        return payload
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> 'FacebookMessage':
+        """
+        Rebuild a message from the output of `to_payload`.
+        """
+        msg_type = FacebookMessageType[payload['type']]
+        event = {
+            'sender': {'id': payload['sender']},
+            'recipient': {'id': payload['recipient']},
+            'timestamp': payload.get('timestamp'),
+        }
+
+        if msg_type in (FacebookMessageType.received, FacebookMessageType.echo):
+            message = {'mid': payload.get('mid'), 'text': payload.get('text')}
+            if msg_type == FacebookMessageType.echo:
+                message['is_echo'] = True
+            if payload.get('quick_reply_payload') is not None:
+                message['quick_reply'] = {'payload': payload['quick_reply_payload']}
+            if payload.get('attachments'):
+                message['attachments'] = payload['attachments']
+            event['message'] = message
+        elif msg_type == FacebookMessageType.delivered:
+            event['delivery'] = {'mids': payload.get('mids', []),
+                                 'watermark': payload['watermark'],
+                                 'seq': payload.get('seq')}
+        elif msg_type == FacebookMessageType.read:
+            event['read'] = {'watermark': payload['watermark'],
+                             'seqs': payload.get('seq')}
+        elif msg_type == FacebookMessageType.postback:
+            event['postback'] = {'payload': payload['postback_payload']}
+
+        message = cls(event)
+        message.page_id = payload.get('page')
+        return message
+
+
+FacebookMessage.DISPATCHERS = {
+    FacebookMessageType.received: FacebookMessage._process_received,
+    FacebookMessageType.delivered: FacebookMessage._process_delivered,
+    FacebookMessageType.read: FacebookMessage._process_read,
+    FacebookMessageType.echo: FacebookMessage._process_echo,
+    FacebookMessageType.postback: FacebookMessage._process_postback,
+}
 
 
 class FacebookEntry:
+    __slots__ = ('id', 'changed_fields', 'changes', 'timestamp', 'messages')
+
     def __init__(self, entry: Dict[str, Any]):
         self.id = entry.get('id')
         self.changed_fields = entry.get('changed_fields', [])
@@ -321,119 +484,166 @@ class FacebookEntry:
         self.messages = self.process_messages(entry['messaging'])
 
     def process_messages(self, entries: List[Dict[str, Any]]) -> List[FacebookMessage]:
-        messages = []
-        for message in entries:
-            messages.append(
-                FacebookMessage(message)
-            )
+        messages = [FacebookMessage(message) for message in entries]
+        for message in messages:
+            message.page_id = self.id
         return messages
 
 
-class Messager:
-    BASE_URL = "https://graph.facebook.com/v2.9/{}"
+class BoundTemplate(dict):
+    """
+    Send API message of a `MessageTemplate` for a recipient, whose JSON `body` is already rendered.
+    """
+    __slots__ = ('body',)
+
+
+class MessageTemplate:
+    """
+    Send API message serialized once, only its recipient changes from a send to another.
+    The message must not be modified afterwards: the serialized form would not follow.
+    """
+    __slots__ = ('message', '_head', '_tail')
+
+    def __init__(self, message: Dict[str, Any]):
+        self.message = message
+        self._head = '{{"{}": {{"{}": '.format(RECIPIENT_FIELD, Recipient.ID.value).encode()
+        self._tail = '}}, "{}": {}}}'.format(MESSAGE_FIELD, json.dumps(message)).encode()
+
+    def render(self, user_id) -> bytes:
+        return b''.join((self._head, json.dumps(user_id).encode(), self._tail))
+
+    def bind(self, user_id) -> BoundTemplate:
+        bound = BoundTemplate(((RECIPIENT_FIELD, {Recipient.ID.value: user_id}), (MESSAGE_FIELD, self.message)))
+        bound.body = self.render(user_id)
+        return bound
+
+
+class BaseMessager:
+    """
+    Builds Send API payloads, shared by the synchronous and asyncio messagers.
+    Subclasses only implement how requests are performed, through `_post` and `_send`.
+    """
+    GRAPH_URL = "https://graph.facebook.com/"
+    API_VERSION = "v2.9"
+    BASE_URL = GRAPH_URL + API_VERSION + "/{}"
 
-    def __init__(self, access_token):
+    def __init__(self, access_token, graph_url=None):
         self.access_token = access_token
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json'
-        })
-        self.session.params = {
-            'access_token': self.access_token
-        }
+        if graph_url is not None:
+            self.GRAPH_URL = graph_url
+            self.BASE_URL = graph_url + self.API_VERSION + "/{}"
 
     def subscribe_to_page(self):
-        return self.session.post(self.BASE_URL.format("me/subscribed_apps"))
+        return self._post("me/subscribed_apps")
 
     def set_greeting_text(self, text):
         data = {"setting_type": "greeting", "greeting": {"text": text}}
-        return self.session.post(self.BASE_URL.format("me/thread_settings"),
-                                 data=json.dumps(data))
+        return self._post("me/thread_settings", data)
 
     def set_get_started_button_payload(self, payload):
         data = {"setting_type": "call_to_actions", "thread_state": "new_thread",
                 "call_to_actions": [{"payload": payload}]}
-        return self.session.post(self.BASE_URL.format("me/thread_settings"),
-                                 data=json.dumps(data))
+        return self._post("me/thread_settings", data)
 
     def send_text(self, user_id, text):
-        self._send({RECIPIENT_FIELD: self._build_recipient(user_id),
-                    MESSAGE_FIELD: {MessageType.TEXT.value: text}})
+        return self._send(self.build_text(user_id, text))
 
     def send_image(self, user_id, image):
-        self._send({RECIPIENT_FIELD: self._build_recipient(user_id),
-                    MESSAGE_FIELD: {
-                        ATTACHMENT_FIELD: {
-                            TYPE_FIELD: AttachmentType.IMAGE.value,
-                            PAYLOAD_FIELD: {
-                                URL_FIELD: image
-                            }
-                        }
-                    }})
+        return self._send(self.build_image(user_id, image))
 
     def send_buttons(self, user_id, title, button_list):
+        return self._send(self.build_buttons(user_id, title, button_list))
+
+    def send_generic(self, user_id, element_list):
+        return self._send(self.build_generic(user_id, element_list))
+
+    def send_quick_replies(self, user_id, title, reply_list):
+        return self._send(self.build_quick_replies(user_id, title, reply_list))
+
+    def send_template(self, user_id, template: MessageTemplate):
+        return self._send(template.bind(user_id))
+
+    def typing(self, user_id, on=True):
+        data = {RECIPIENT_FIELD: {"id": user_id}, "sender_action": "typing_on" if on else "typing_off"}
+        return self._post("me/messages", data)
+
+    @classmethod
+    def build_text(cls, user_id, text):
+        return {RECIPIENT_FIELD: cls._build_recipient(user_id),
+                MESSAGE_FIELD: {MessageType.TEXT.value: text}}
+
+    @classmethod
+    def build_image(cls, user_id, image):
+        return {RECIPIENT_FIELD: cls._build_recipient(user_id),
+                MESSAGE_FIELD: {
+                    ATTACHMENT_FIELD: {
+                        TYPE_FIELD: AttachmentType.IMAGE.value,
+                        PAYLOAD_FIELD: {
+                            URL_FIELD: image
+                        }
+                    }
+                }}
+
+    @classmethod
+    def build_buttons(cls, user_id, title, button_list):
         buttons = list(dict())
         for i in range(len(button_list)):
             buttons.append(button_list[i].to_dict())
 
-        self._send({RECIPIENT_FIELD: self._build_recipient(user_id),
-                    MESSAGE_FIELD: {
-                        ATTACHMENT_FIELD: {
-                            TYPE_FIELD: AttachmentType.TEMPLATE.value,
-                            PAYLOAD_FIELD: {
-                                TEMPLATE_TYPE_FIELD: TemplateType.BUTTON.value,
-                                TEXT_FIELD: title,
-                                BUTTONS_FIELD: buttons
-                            }
+        return {RECIPIENT_FIELD: cls._build_recipient(user_id),
+                MESSAGE_FIELD: {
+                    ATTACHMENT_FIELD: {
+                        TYPE_FIELD: AttachmentType.TEMPLATE.value,
+                        PAYLOAD_FIELD: {
+                            TEMPLATE_TYPE_FIELD: TemplateType.BUTTON.value,
+                            TEXT_FIELD: title,
+                            BUTTONS_FIELD: buttons
                         }
-                    }})
+                    }
+                }}
 
-    def send_generic(self, user_id, element_list):
+    @classmethod
+    def build_generic(cls, user_id, element_list):
         elements = list(dict())
         for i in range(len(element_list)):
             elements.append(element_list[i].to_dict())
-        self._send({RECIPIENT_FIELD: self._build_recipient(user_id),
-                    MESSAGE_FIELD: {
-                        ATTACHMENT_FIELD: {
-                            TYPE_FIELD: AttachmentType.TEMPLATE.value,
-                            PAYLOAD_FIELD: {
-                                TEMPLATE_TYPE_FIELD: TemplateType.GENERIC.value,
-                                ELEMENTS_FIELD: elements
-                            }
+        return {RECIPIENT_FIELD: cls._build_recipient(user_id),
+                MESSAGE_FIELD: {
+                    ATTACHMENT_FIELD: {
+                        TYPE_FIELD: AttachmentType.TEMPLATE.value,
+                        PAYLOAD_FIELD: {
+                            TEMPLATE_TYPE_FIELD: TemplateType.GENERIC.value,
+                            ELEMENTS_FIELD: elements
                         }
-                    }})
+                    }
+                }}
 
-    def send_quick_replies(self, user_id, title, reply_list):
+    @classmethod
+    def build_quick_replies(cls, user_id, title, reply_list):
         replies = list(dict())
         for r in reply_list:
             replies.append(r.to_dict())
-        self._send({RECIPIENT_FIELD: self._build_recipient(user_id),
-                    MESSAGE_FIELD: {
-                        TEXT_FIELD: title,
-                        QUICK_REPLIES_FIELD: replies
-                    }})
+        return {RECIPIENT_FIELD: cls._build_recipient(user_id),
+                MESSAGE_FIELD: {
+                    TEXT_FIELD: title,
+                    QUICK_REPLIES_FIELD: replies
+                }}
 
-    def typing(self, user_id, on=True):
-        data = {RECIPIENT_FIELD: {"id": user_id}, "sender_action": "typing_on" if on else "typing_off"}
-        return self.session.post(self.BASE_URL.format("me/messages"), data=json.dumps(data))
+    @classmethod
+    def template_text(cls, text) -> MessageTemplate:
+        return MessageTemplate(cls.build_text(None, text)[MESSAGE_FIELD])
 
-    def fetch_user(self, user_id, fields: List[str] = None) -> FacebookEntity:
-        if fields is None:
-            fields = FacebookEntity.USER_FIELDS
-
-        entity = FacebookEntity(user_id)
-        resp = self.session.get(
-            self.BASE_URL
-            .format('/{}'),
-            params={
-                'fields': ','.join(fields)
-            }
-        )
+    @classmethod
+    def template_buttons(cls, title, button_list) -> MessageTemplate:
+        return MessageTemplate(cls.build_buttons(None, title, button_list)[MESSAGE_FIELD])
 
-        resp.raise_for_status()
+    @classmethod
+    def template_generic(cls, element_list) -> MessageTemplate:
+        return MessageTemplate(cls.build_generic(None, element_list)[MESSAGE_FIELD])
 
-        entity.hydrate_user_from_api(resp.json())
-        return entity
+    @classmethod
+    def template_quick_replies(cls, title, reply_list) -> MessageTemplate:
+        return MessageTemplate(cls.build_quick_replies(None, title, reply_list)[MESSAGE_FIELD])
 
     @staticmethod
     def unserialize_received_request(object_type: str, json_entries: Dict[str, Any]) -> List[FacebookMessage]:
@@ -451,15 +661,301 @@ class Messager:
     def _build_recipient(user_id):
         return {Recipient.ID.value: user_id}
 
+    @staticmethod
+    def _serialize(message_data) -> Any:
+        if isinstance(message_data, BoundTemplate):
+            return message_data.body
+        return json.dumps(message_data)
+
+    @staticmethod
+    def _log_reply(status, reason, text, message_data):
+        # One record per send: successful ones are sampled, see web.log.
+        logger.info('[%s/%s/%s] Reply to %s: %s', status, reason, text,
+                    message_data[RECIPIENT_FIELD], message_data[MESSAGE_FIELD],
+                    extra={'sampled': status is not None and 200 <= status < 300})
+
+    def _post(self, path, data=None):
+        raise NotImplementedError
+
+    def _send(self, message_data):
+        raise NotImplementedError
+
+
+class Messager(BaseMessager):
+    """
+    Synchronous messager, safe to share between threads (and greenlets):
+    at most `pool_size` connections to the Graph API are open at once, other callers wait for one.
+    """
+    #: Graph API limit on the number of ids of a multi-id lookup.
+    MAX_IDS_PER_LOOKUP = 50
+
+    def __init__(self, access_token, graph_url=None,
+                 rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None,
+                 profile_cache: TieredCache = None, pool_size: int = 10):
+        super().__init__(access_token, graph_url)
+        self._local = threading.local()  # The batch of `batch()`, only for the thread which opened it.
+        self.profile_cache = profile_cache if profile_cache is not None else TieredCache()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        #: Counts throttled, retried, rate limited and dropped sends.
+        self.stats = Counter()
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json'
+        })
+        self.session.params = {
+            'access_token': self.access_token
+        }
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def _batch(self) -> Optional[MessageBatch]:
+        return getattr(self._local, 'batch', None)
+
+    @_batch.setter
+    def _batch(self, batch: Optional[MessageBatch]):
+        self._local.batch = batch
+
+    def fetch_user(self, user_id, fields: List[str] = None) -> FacebookEntity:
+        return self.fetch_users([user_id], fields)[str(user_id)]
+
+    def fetch_users(self, user_ids: List[str], fields: List[str] = None) -> Dict[str, FacebookEntity]:
+        """
+        Fetch several user profiles, through the profile cache first.
+        Missing ones are looked up with the Graph multi-id lookup, `MAX_IDS_PER_LOOKUP` at a time.
+        """
+        if fields is None:
+            fields = FacebookEntity.USER_FIELDS
+
+        profiles = {}
+        missing = []
+        for user_id in map(str, user_ids):
+            data = self.profile_cache.get(self._profile_key(user_id, fields))
+            if data is None:
+                missing.append(user_id)
+            else:
+                profiles[user_id] = data
+
+        for start in range(0, len(missing), self.MAX_IDS_PER_LOOKUP):
+            chunk = missing[start:start + self.MAX_IDS_PER_LOOKUP]
+            resp = self.session.get(
+                self.BASE_URL
+                .format(''),
+                params={
+                    'ids': ','.join(chunk),
+                    'fields': ','.join(fields)
+                }
+            )
+
+            resp.raise_for_status()
+
+            for user_id, data in resp.json().items():
+                self.profile_cache.set(self._profile_key(user_id, fields), data)
+                profiles[user_id] = data
+
+        entities = {}
+        for user_id, data in profiles.items():
+            entity = FacebookEntity({'id': user_id})
+            entity.hydrate_user_from_api(data)
+            entities[user_id] = entity
+        return entities
+
+    @staticmethod
+    def _profile_key(user_id, fields: List[str]) -> str:
+        return '{}:{}'.format(user_id, ','.join(fields))
+
+    @contextmanager
+    def batch(self, max_size: int = MAX_BATCH_SIZE, max_delay: float = 1.0, on_result=None):
+        """
+        Within this context, the `send_*` calls of this thread are gathered and sent as Graph API batch requests.
+        They return a `BatchItem`, resolved with the per-message outcome once its batch is flushed.
+        """
+        batch = MessageBatch(self.session, self.GRAPH_URL, self.API_VERSION + "/me/messages",
+                             max_size=max_size, max_delay=max_delay, on_result=on_result)
+        previous, self._batch = self._batch, batch
+        try:
+            yield batch
+        finally:
+            self._batch = previous
+            batch.close()
+
+    def broadcast(self, recipients: Iterable[Any], message, concurrency: int = 8, checkpoint=None,
+                  checkpoint_every: int = 100, log=None) -> BroadcastReport:
+        """
+        Sends `message`, a `MessageTemplate` or a Send API message dict, to a stream of recipient ids.
+        See `facebook.broadcast.broadcast`.
+        """
+        if not isinstance(message, MessageTemplate):
+            message = MessageTemplate(message)
+        return broadcast(self, recipients, message, concurrency=concurrency, checkpoint=checkpoint,
+                         checkpoint_every=checkpoint_every, log=log)
+
+    def _post(self, path, data=None):
+        return self.session.post(self.BASE_URL.format(path),
+                                 data=json.dumps(data) if data is not None else None)
+
     def _send(self, message_data):
+        if self._batch is not None:
+            return self._batch.add(message_data)
+
         post_message_url = self.BASE_URL.format("me/messages")
-        response_message = json.dumps(message_data)
-        logger.debug('Message: {}'.format(response_message))
-        req = self.session.post(post_message_url,
-                                data=response_message)
-        logger.info("[{status}/{reason}/{text}] Reply to {recipient}: {content}".format(
-            status=req.status_code,
-            reason=req.reason,
-            text=req.text,
-            recipient=message_data[RECIPIENT_FIELD],
-            content=message_data[MESSAGE_FIELD]))
+        response_message = self._serialize(message_data)
+        recipient_id = message_data[RECIPIENT_FIELD].get(Recipient.ID.value)
+        logger.debug('Message: %s', response_message)
+
+        attempt = 0
+        while True:
+            if self.rate_limiter.acquire(recipient_id) > 0:
+                self.stats['throttled'] += 1
+
+            try:
+                req = self.session.post(post_message_url,
+                                        data=response_message)
+            except requests.RequestException:
+                if attempt >= self.retry_policy.max_retries:
+                    self.stats['dropped'] += 1
+                    raise
+                logger.warning('Reply to %s failed, retrying.', recipient_id, exc_info=True)
+                delay = self.retry_policy.backoff(attempt)
+            else:
+                self._log_reply(req.status_code, req.reason, req.text, message_data)
+                delay = self.retry_policy.retry_delay(req, attempt)
+                rate_limited = not req.ok and self.retry_policy.is_rate_limited(req)
+                if rate_limited:
+                    self.stats['rate_limited'] += 1
+                    # Limited for longer than we wait (no retry then): only hold the next sends that long.
+                    self.rate_limiter.pause(delay if delay is not None else self.retry_policy.max_delay)
+
+                if delay is None:
+                    if not req.ok:
+                        self.stats['dropped'] += 1
+                    return req
+
+                if attempt >= self.retry_policy.max_retries:
+                    self.stats['dropped'] += 1
+                    return req
+
+            self.stats['retries'] += 1
+            attempt += 1
+            time.sleep(delay)
+
+
+class _Reply:
+    """
+    What `RetryPolicy` reads of a Graph API reply, for replies which are not `requests` responses.
+    """
+    __slots__ = ('status_code', 'headers', 'text')
+
+    def __init__(self, status_code: int, headers, text: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncMessager(BaseMessager):
+    """
+    asyncio counterpart of `Messager`, every request method is a coroutine.
+
+    Connections are pooled: at most `pool_size` are open at once, `per_host_limit` towards
+    the Graph API, further requests wait for a free connection. `timeout` bounds each request.
+    Failed sends are retried according to `retry_policy`, like those of `Messager`.
+    """
+
+    def __init__(self, access_token, graph_url=None, pool_size: int = 100, per_host_limit: int = 100,
+                 timeout: float = 10.0, retry_policy: RetryPolicy = None):
+        super().__init__(access_token, graph_url)
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        #: Counts retried and dropped sends.
+        self.stats = Counter()
+        self._session = None
+
+    @property
+    def session(self) -> 'aiohttp.ClientSession':
+        # Imported here, only the processes using this messager pay for it.
+        import aiohttp
+
+        # Created lazily, aiohttp sessions must be bound to the running event loop.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size,
+                                               limit_per_host=self.per_host_limit),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Content-Type': 'application/json'},
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> 'AsyncMessager':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def fetch_user(self, user_id, fields: List[str] = None) -> FacebookEntity:
+        if fields is None:
+            fields = FacebookEntity.USER_FIELDS
+
+        entity = FacebookEntity({'id': user_id})
+        async with self.session.get(self.BASE_URL.format(user_id),
+                                    params={'access_token': self.access_token,
+                                            'fields': ','.join(fields)}) as resp:
+            resp.raise_for_status()
+            entity.hydrate_user_from_api(await resp.json(content_type=None))
+
+        return entity
+
+    async def _post(self, path, data=None):
+        async with self.session.post(self.BASE_URL.format(path),
+                                     params={'access_token': self.access_token},
+                                     data=json.dumps(data) if data is not None else None) as resp:
+            await resp.read()
+            return resp
+
+    async def _send(self, message_data):
+        import aiohttp
+
+        response_message = self._serialize(message_data)
+        recipient_id = message_data[RECIPIENT_FIELD].get(Recipient.ID.value)
+        logger.debug('Message: %s', response_message)
+
+        attempt = 0
+        while True:
+            try:
+                async with self.session.post(self.BASE_URL.format("me/messages"),
+                                             params={'access_token': self.access_token},
+                                             data=response_message) as resp:
+                    text = await resp.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.retry_policy.max_retries:
+                    self.stats['dropped'] += 1
+                    raise
+                logger.warning('Reply to %s failed, retrying.', recipient_id, exc_info=True)
+                delay = self.retry_policy.backoff(attempt)
+            else:
+                self._log_reply(resp.status, resp.reason, text, message_data)
+                reply = _Reply(resp.status, resp.headers, text)
+                delay = self.retry_policy.retry_delay(reply, attempt)
+                if delay is None or attempt >= self.retry_policy.max_retries:
+                    if not reply.ok:
+                        self.stats['dropped'] += 1
+                    return resp
+
+            self.stats['retries'] += 1
+            attempt += 1
+            await asyncio.sleep(delay)
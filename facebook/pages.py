@@ -0,0 +1,82 @@
+# -*- coding: utf8 -*-
+import logging
+import threading
+import time
+from collections import OrderedDict, Counter
+from typing import Callable, Dict, Optional
+
+from .messager import Messager
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownPage(KeyError):
+    pass
+
+
+class PageRegistry:
+    """
+    Messager of each page, created on first use from its access token by `factory`.
+
+    Every page gets its own messager, hence its own connection pool and rate budget:
+    a page throttled by the Graph API does not hold back the others.
+    Messagers unused for `max_idle` seconds are dropped, and at most `max_pages` are kept, least recently used first.
+    They are not closed: a request may still be using one, its connections are closed once it is garbage collected.
+    Pages missing from `tokens` use `default_token`, if any.
+    """
+
+    def __init__(self, tokens: Dict[str, str], factory: Callable[[str], Messager],
+                 default_token: Optional[str] = None, max_idle: float = 600.0, max_pages: int = 64,
+                 clock: Callable[[], float] = time.monotonic):
+        self.tokens = tokens
+        self.factory = factory
+        self.default_token = default_token
+        self.max_idle = max_idle
+        self.max_pages = max_pages
+        self.clock = clock
+        self.stats = Counter()
+
+        # Page id → (messager, last used), least recently used first.
+        self._messagers = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._messagers)
+
+    def token(self, page_id: Optional[str]) -> str:
+        token = self.tokens.get(page_id, self.default_token)
+        if token is None:
+            raise UnknownPage(page_id)
+        return token
+
+    def get(self, page_id: Optional[str] = None) -> Messager:
+        """
+        Messager of `page_id`, or of the default page. Raises `UnknownPage` if there is no token for it.
+        """
+        # All the pages without a token of their own share the default one.
+        key = page_id if page_id in self.tokens else None
+
+        with self._lock:
+            now = self.clock()
+            entry = self._messagers.pop(key, None)
+            if entry is None:
+                messager = self.factory(self.token(page_id))
+                self.stats['created'] += 1
+            else:
+                messager = entry[0]
+            self._messagers[key] = (messager, now)
+            self._evict(now)
+        return messager
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict(self.clock())
+
+    def _evict(self, now: float):
+        while self._messagers:
+            page_id, (_, last_used) = next(iter(self._messagers.items()))
+            if len(self._messagers) <= self.max_pages and now - last_used < self.max_idle:
+                return
+            del self._messagers[page_id]
+            self.stats['evictions'] += 1
+            logger.debug('Dropped the messager of page %s.', page_id)
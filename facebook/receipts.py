@@ -0,0 +1,209 @@
+# -*- coding: utf8 -*-
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .messager import FacebookMessage, FacebookMessageType
+
+logger = logging.getLogger(__name__)
+
+DELIVERED = 'delivered'
+READ = 'read'
+
+# Both watermarks of a sender are packed in one int: delivered in the low 64 bits, read above. 0 when unknown.
+_SHIFTS = {DELIVERED: 0, READ: 64}
+_MASK = (1 << 64) - 1
+
+# Raises the watermark of each field, never lowers it.
+# KEYS[1]: hash of watermarks; ARGV: field, watermark, field, watermark…
+_RAISE_WATERMARKS = """
+for i = 1, #ARGV, 2 do
+    local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]))
+    if not current or current < tonumber(ARGV[i + 1]) then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+"""
+
+
+def _compact(sender_id: str) -> Union[int, str]:
+    """
+    Page-scoped user ids are numeric: as ints, they take half the memory of strings.
+    """
+    try:
+        number = int(sender_id)
+    except ValueError:
+        return sender_id
+    return number if str(number) == sender_id else sender_id
+
+
+class WatermarkIndex:
+    """
+    Latest delivery and read watermarks (timestamps in milliseconds) of each sender.
+
+    Receipts come in bursts: each one only raises the watermark of its sender in memory,
+    and the watermarks which changed are written to Redis (`<prefix>:delivered` and `<prefix>:read` hashes)
+    by `flush`, in pipelined batches of `batch_size`. `flush_if_due` flushes every `flush_size` changed
+    senders or `flush_interval` seconds; a timer flushes the changes left `flush_interval` seconds after
+    the first of them, so that they reach Redis even when no more receipts come.
+
+    Without Redis, the index only lives in this process, and only the `max_senders` most recently updated
+    senders are kept (about 150 bytes each): the others are forgotten, as if no receipt was known.
+    Beyond that many users, set up Redis. With it, `max_senders` bounds the changes kept while Redis is down.
+
+    A read receipt implies the delivery of the same messages.
+    """
+
+    def __init__(self, redis=None, prefix: str = 'receipts', flush_size: int = 1000, flush_interval: float = 1.0,
+                 batch_size: int = 500, max_senders: int = 100000, clock: Callable[[], float] = time.monotonic):
+        self.redis = redis
+        self.prefix = prefix
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_senders = max_senders
+        self.clock = clock
+        self.stats = Counter()
+
+        # Sender → packed watermarks, least recently updated first:
+        # pending changes with Redis, the whole index otherwise.
+        self._watermarks = OrderedDict()  # type: OrderedDict
+        self._flushed_at = clock()
+        self._timer = None  # type: Optional[threading.Timer]
+        self._lock = threading.Lock()
+        self._raise_watermarks = redis.register_script(_RAISE_WATERMARKS) if redis is not None else None
+
+    def _key(self, kind: str) -> str:
+        return '{}:{}'.format(self.prefix, kind)
+
+    def _raise(self, kind: str, sender: Union[int, str], watermark: int):
+        shift = _SHIFTS[kind]
+        packed = self._watermarks.get(sender, 0)
+        current = packed >> shift & _MASK
+        if current < watermark:
+            packed = packed & ~(_MASK << shift) | watermark << shift
+        if current:
+            self.stats['collapsed'] += 1
+        self._watermarks[sender] = packed
+        self._watermarks.move_to_end(sender)
+
+    def _evict(self):
+        while len(self._watermarks) > self.max_senders:
+            self._watermarks.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def add(self, messages: Iterable[FacebookMessage]):
+        with self._lock:
+            for message in messages:
+                if message.watermark is None:
+                    continue
+                self.stats['receipts'] += 1
+                if message.type == FacebookMessageType.delivered:
+                    self._raise(DELIVERED, _compact(message.sender.id), message.watermark)
+                elif message.type == FacebookMessageType.read:
+                    self._raise(READ, _compact(message.sender.id), message.watermark)
+            self._evict()
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        # Called with the lock held.
+        if self.redis is None or not self._watermarks or self._timer is not None:
+            return
+        self._timer = threading.Timer(self.flush_interval, self._flush_later)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_later(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def __len__(self):
+        return len(self._watermarks)
+
+    def pending(self) -> int:
+        if self.redis is None:
+            return 0
+        return len(self._watermarks)
+
+    def flush_if_due(self):
+        if self.pending() >= self.flush_size or self.clock() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the changed watermarks to Redis. On failure, they are kept for the next flush.
+        """
+        if self.redis is None:
+            return
+
+        with self._lock:
+            changes, self._watermarks = self._watermarks, OrderedDict()
+            self._flushed_at = self.clock()
+        if not changes:
+            return
+
+        unpacked = {kind: [] for kind in _SHIFTS}  # type: Dict[str, List[Tuple[Union[int, str], int]]]
+        for sender, packed in changes.items():
+            for kind, shift in _SHIFTS.items():
+                watermark = packed >> shift & _MASK
+                if watermark:
+                    unpacked[kind].append((sender, watermark))
+
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for kind, items in unpacked.items():
+                for start in range(0, len(items), self.batch_size):
+                    args = [value for item in items[start:start + self.batch_size] for value in item]
+                    self._raise_watermarks(keys=[self._key(kind)], args=args, client=pipeline)
+            pipeline.execute()
+        except Exception:
+            logger.warning('Could not flush %d watermarks, keeping them for later.',
+                           sum(len(items) for items in unpacked.values()), exc_info=True)
+            self.stats['flush_errors'] += 1
+            with self._lock:
+                for kind, items in unpacked.items():
+                    for sender, watermark in items:
+                        self._raise(kind, sender, watermark)
+                self._evict()
+                self._schedule_flush()
+            return
+
+        self.stats['flushes'] += 1
+        self.stats['flushed'] += sum(len(items) for items in unpacked.values())
+
+    def watermark(self, kind: str, sender_id: str) -> Optional[int]:
+        """
+        Latest `DELIVERED` or `READ` watermark of `sender_id`, None if no receipt is known.
+        """
+        with self._lock:
+            local = self._watermarks.get(_compact(sender_id), 0) >> _SHIFTS[kind] & _MASK or None
+        if self.redis is None:
+            return local
+
+        try:
+            shared = self.redis.hget(self._key(kind), sender_id)
+        except Exception:
+            logger.warning('Shared watermarks unavailable, reading %s.', sender_id, exc_info=True)
+            return local
+        if shared is None:
+            return local
+        return max(int(shared), local or 0)
+
+    def has_read(self, sender_id: str, timestamp: int) -> bool:
+        """
+        Whether `sender_id` read the messages we sent up to `timestamp`.
+        """
+        watermark = self.watermark(READ, sender_id)
+        return watermark is not None and watermark >= timestamp
+
+    def has_delivered(self, sender_id: str, timestamp: int) -> bool:
+        """
+        Whether the messages we sent to `sender_id` up to `timestamp` were delivered.
+        """
+        if self.has_read(sender_id, timestamp):
+            return True
+        watermark = self.watermark(DELIVERED, sender_id)
+        return watermark is not None and watermark >= timestamp
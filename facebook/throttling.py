@@ -0,0 +1,173 @@
+# -*- coding: utf8 -*-
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Callable
+
+import requests
+
+#: Graph API error codes meaning we are going too fast (app, user, page and Messenger limits).
+RATE_LIMIT_ERROR_CODES = frozenset((4, 17, 32, 613))
+#: Graph API error codes for temporary failures, worth retrying.
+TRANSIENT_ERROR_CODES = frozenset((1, 2))
+
+USAGE_HEADERS = ('X-Business-Use-Case-Usage', 'X-Page-Usage', 'X-App-Usage')
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `capacity` tokens.
+
+    `reserve` takes a token right away, possibly going in debt,
+    and returns how long the caller has to wait before using it.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated_at = clock()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+
+class RateLimiter:
+    """
+    Global token bucket, plus one bucket per recipient.
+    Only the `max_recipients` most recently used recipient buckets are kept.
+    """
+
+    def __init__(self, global_rate: float = 200.0, global_burst: float = 200.0,
+                 recipient_rate: float = 1.0, recipient_burst: float = 5.0,
+                 max_recipients: int = 10000, sleep: Callable[[float], None] = time.sleep):
+        self.bucket = TokenBucket(global_rate, global_burst)
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.max_recipients = max_recipients
+        self.sleep = sleep
+
+        self._recipients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recipient_bucket(self, recipient_id) -> TokenBucket:
+        with self._lock:
+            bucket = self._recipients.get(recipient_id)
+            if bucket is None:
+                bucket = self._recipients[recipient_id] = TokenBucket(self.recipient_rate, self.recipient_burst)
+                if len(self._recipients) > self.max_recipients:
+                    self._recipients.popitem(last=False)
+            else:
+                self._recipients.move_to_end(recipient_id)
+            return bucket
+
+    def acquire(self, recipient_id=None) -> float:
+        """
+        Block until a request to `recipient_id` may be performed, return the time waited.
+        """
+        wait = self.bucket.reserve()
+        if recipient_id is not None:
+            wait = max(wait, self._recipient_bucket(recipient_id).reserve())
+
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        """
+        Hold every request for `seconds`, used once the Graph API told us to slow down.
+        """
+        self.bucket.pause(seconds)
+
+
+class RetryPolicy:
+    """
+    Decides whether a Graph API call is retried, and after how long.
+
+    Delays grow exponentially from `base_delay` up to `max_delay`, with full jitter.
+    When rate limited, the delay announced by the Graph API headers is honored if longer,
+    but no call waits beyond `max_delay`: a longer announced delay (it can be hours) is not retried.
+    """
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def error_code(response: requests.Response) -> Optional[int]:
+        try:
+            return response.json().get('error', {}).get('code')
+        except (ValueError, AttributeError):
+            return None
+
+    @classmethod
+    def is_rate_limited(cls, response: requests.Response) -> bool:
+        return response.status_code == 429 or cls.error_code(response) in RATE_LIMIT_ERROR_CODES
+
+    @classmethod
+    def is_transient(cls, response: requests.Response) -> bool:
+        return response.status_code >= 500 or cls.error_code(response) in TRANSIENT_ERROR_CODES
+
+    @staticmethod
+    def announced_delay(response: requests.Response) -> float:
+        """
+        Delay requested through `Retry-After`, or the time to regain access from the usage headers.
+        """
+        delay = 0.0
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                pass
+
+        for header in USAGE_HEADERS:
+            try:
+                usage = json.loads(response.headers.get(header) or '{}')
+            except ValueError:
+                continue
+            # Business use case usage is keyed by object id, each holding a list of usages.
+            usages = [u for values in usage.values() if isinstance(values, list) for u in values]
+            for u in usages + [usage]:
+                if isinstance(u, dict) and u.get('estimated_time_to_regain_access'):
+                    delay = max(delay, 60.0 * float(u['estimated_time_to_regain_access']))
+
+        return delay
+
+    def retry_delay(self, response: requests.Response, attempt: int) -> Optional[float]:
+        """
+        How long to wait before retrying, at most `max_delay`; None if this response should not be retried.
+        """
+        if response.ok:
+            return None
+
+        if self.is_rate_limited(response):
+            announced = self.announced_delay(response)
+            if announced > self.max_delay:
+                return None
+            return max(self.backoff(attempt), announced)
+
+        if self.is_transient(response):
+            return self.backoff(attempt)
+
+        return None
@@ -0,0 +1,16 @@
+"""
+Gunicorn settings: `gunicorn -c gunicorn.conf.py web:app`, see GUNICORN_* in .env.template.
+"""
+import decouple  # Not `from decouple import config`: gunicorn reads every module level name as a setting.
+
+worker_class = decouple.config('GUNICORN_WORKER_CLASS', default='sync')
+workers = decouple.config('GUNICORN_WORKERS', cast=int,
+                          default=decouple.config('WEB_CONCURRENCY', cast=int, default=1))
+threads = decouple.config('GUNICORN_THREADS', cast=int, default=1)
+worker_connections = decouple.config('GUNICORN_WORKER_CONNECTIONS', cast=int, default=1000)
+
+
+def child_exit(server, worker):
+    # Metrics of exited workers are merged, not left behind as live series.
+    from web.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
@@ -0,0 +1,12 @@
+import os
+
+# Settings required by the web package, set before it is imported.
+for key, value in (('FACEBOOK_SECRET', 'test-secret'),
+                   ('GREETING_TEXT', 'Test'),
+                   ('FACEBOOK_VERIFICATION_TOKEN', 'test'),
+                   ('FACEBOOK_ACCESS_TOKEN', 'test'),
+                   ('RECAST_AI_TOKEN', 'test'),
+                   ('NLP_BACKEND', 'fake'),
+                   ('CELERY_CONFIG_MODULE', 'background.config.test.CeleryTesting'),
+                   ('LOGGING_QUEUE', 'False')):
+    os.environ.setdefault(key, value)
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from bench.stubs import StubGraphAPI
+from facebook.messager import AsyncMessager
+from facebook.throttling import RetryPolicy
+
+
+class FlakyGraphAPI(StubGraphAPI):
+    """
+    Answers the first `failures` sends with a transient error, records the recipients of the others.
+    """
+
+    def __init__(self, failures=0, status=500):
+        super().__init__()
+        self.failures = failures
+        self.status = status
+        self.received = []
+
+    def respond(self, method, url, body):
+        if self.failures > 0:
+            self.failures -= 1
+            return self.status, {'error': {'message': 'An unexpected error has occurred.', 'code': 2}}
+        self.received.append(json.loads(body.decode()))
+        return super().respond(method, url, body)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def send_all(messager, recipients):
+    async with messager:
+        return await asyncio.gather(*(messager.send_text(recipient, 'Bonjour !') for recipient in recipients))
+
+
+def test_sends_share_the_connection_pool():
+    with FlakyGraphAPI() as graph:
+        messager = AsyncMessager('token', graph_url=graph.url, pool_size=2)
+        responses = run(send_all(messager, [str(n) for n in range(10)]))
+
+    assert [response.status for response in responses] == [200] * 10
+    assert sorted(int(message['recipient']['id']) for message in graph.received) == list(range(10))
+    assert graph.received[0]['message'] == {'text': 'Bonjour !'}
+    assert messager.stats == {}
+
+
+def test_transient_errors_are_retried():
+    with FlakyGraphAPI(failures=2) as graph:
+        messager = AsyncMessager('token', graph_url=graph.url,
+                                 retry_policy=RetryPolicy(max_retries=3, base_delay=0.01))
+        response, = run(send_all(messager, ['42']))
+
+    assert response.status == 200
+    assert [message['recipient']['id'] for message in graph.received] == ['42']
+    assert messager.stats == {'retries': 2}
+
+
+def test_sends_are_dropped_after_max_retries():
+    with FlakyGraphAPI(failures=10, status=503) as graph:
+        messager = AsyncMessager('token', graph_url=graph.url,
+                                 retry_policy=RetryPolicy(max_retries=2, base_delay=0.01))
+        response, = run(send_all(messager, ['42']))
+
+    assert response.status == 503
+    assert graph.failures == 7
+    assert messager.stats == {'retries': 2, 'dropped': 1}
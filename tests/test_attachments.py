@@ -0,0 +1,200 @@
+import hashlib
+import mmap
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from bench.fixtures import image_message
+from facebook.attachments import AttachmentFetcher, AttachmentStore, AttachmentTooLarge
+from facebook.messager import FacebookMessage
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FileServer:
+    """
+    Serves `files` (path → bytes) in chunks of `chunk_size`, without Content-Length, after `latency` seconds.
+    """
+
+    def __init__(self, files, chunk_size=4096, latency=0.0):
+        self.files = files
+        self.hits = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.hits[self.path] += 1
+                time.sleep(latency)
+                content = server.files.get(self.path)
+                if content is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for start in range(0, len(content), chunk_size):
+                    chunk = content[start:start + chunk_size]
+                    self.wfile.write('{:x}\r\n'.format(len(chunk)).encode() + chunk + b'\r\n')
+                self.wfile.write(b'0\r\n\r\n')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+
+    def url(self, path):
+        return 'http://{}:{}{}'.format(*self.server.server_address[:2], path)
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+@pytest.fixture
+def files():
+    return {
+        '/a.jpg': os.urandom(1000),
+        '/b.jpg': os.urandom(1000),
+        '/c.jpg': os.urandom(1000),
+        '/big.mp4': os.urandom(1024 * 1024 + 17),
+        '/empty.txt': b'',
+    }
+
+
+def test_files_are_named_after_their_content(tmp_path, files):
+    files['/copy-of-a.jpg'] = files['/a.jpg']
+    with FileServer(files) as server:
+        fetcher = AttachmentFetcher(AttachmentStore(str(tmp_path)))
+        digest = fetcher.fetch(server.url('/a.jpg')).result(5)
+        assert fetcher.fetch(server.url('/copy-of-a.jpg')).result(5) == digest
+        assert fetcher.fetch(server.url('/a.jpg')).result(5) == digest
+
+    assert digest == sha256(files['/a.jpg'])
+    path = os.path.join(str(tmp_path), digest[:2], digest)
+    assert fetcher.store.path(digest) == path
+    with open(path, 'rb') as stored:
+        assert stored.read() == files['/a.jpg']
+    # The same content is stored once, a known URL is not downloaded again.
+    assert fetcher.store.size == 1000
+    assert server.hits == {'/a.jpg': 1, '/copy-of-a.jpg': 1}
+    assert fetcher.stats['hits'] == 1
+
+
+def test_concurrent_fetches_of_a_url_share_one_download(tmp_path, files):
+    with FileServer(files, latency=0.1) as server:
+        fetcher = AttachmentFetcher(AttachmentStore(str(tmp_path)))
+        futures = [fetcher.fetch(server.url('/a.jpg')) for _ in range(5)]
+        assert {future.result(5) for future in futures} == {sha256(files['/a.jpg'])}
+    assert server.hits['/a.jpg'] == 1
+
+
+def test_least_recently_used_files_are_evicted_beyond_max_size(tmp_path, files):
+    with FileServer(files) as server:
+        store = AttachmentStore(str(tmp_path), max_size=2500)
+        fetcher = AttachmentFetcher(store)
+        a, b = (fetcher.fetch(server.url(path)).result(5) for path in ('/a.jpg', '/b.jpg'))
+        with fetcher.open(server.url('/a.jpg')):  # More recently used than b.
+            pass
+        c = fetcher.fetch(server.url('/c.jpg')).result(5)
+
+        assert a in store and c in store and b not in store
+        assert not os.path.exists(store.path(b))
+        assert store.size == 2000
+        assert store.stats['evictions'] == 1
+
+        # Downloaded again when needed.
+        assert store.lookup(server.url('/b.jpg')) is None
+        assert fetcher.fetch(server.url('/b.jpg')).result(5) == b
+        assert server.hits['/b.jpg'] == 2
+
+
+def test_files_are_read_through_a_memory_map(tmp_path, files):
+    with FileServer(files) as server:
+        fetcher = AttachmentFetcher(AttachmentStore(str(tmp_path)))
+        with fetcher.open(server.url('/big.mp4'), timeout=5) as content:
+            assert isinstance(content, mmap.mmap)
+            assert content[:100] == files['/big.mp4'][:100]
+            assert content[-10:] == files['/big.mp4'][-10:]
+            assert len(content) == len(files['/big.mp4'])
+        assert content.closed
+
+        with fetcher.open(server.url('/empty.txt'), timeout=5) as content:
+            assert content == b''
+
+    with pytest.raises(KeyError):
+        with fetcher.store.read(sha256(b'missing')):
+            pass
+
+
+def test_large_files_are_streamed_by_chunks(tmp_path, files):
+    with FileServer(files, chunk_size=1000) as server:
+        fetcher = AttachmentFetcher(AttachmentStore(str(tmp_path)), chunk_size=4096)
+        digest = fetcher.fetch(server.url('/big.mp4')).result(5)
+
+        assert digest == sha256(files['/big.mp4'])
+        assert fetcher.stats['downloaded_bytes'] == len(files['/big.mp4'])
+
+        # The download stops at the first chunk over the limit, nothing is kept.
+        limited = AttachmentFetcher(AttachmentStore(str(tmp_path / 'limited')), max_file_size=100 * 1024)
+        with pytest.raises(AttachmentTooLarge):
+            limited.fetch(server.url('/big.mp4')).result(5)
+        with pytest.raises(Exception):
+            limited.fetch(server.url('/missing.jpg')).result(5)
+
+    assert limited.stats['errors'] == 2
+    assert limited.store.size == 0
+    assert os.listdir(limited.store.temporary_directory) == []
+    assert [name for name in os.listdir(str(tmp_path / 'limited')) if name != 'tmp'] == []
+
+
+def test_stored_files_are_found_again_on_restart(tmp_path, files):
+    with FileServer(files) as server:
+        fetcher = AttachmentFetcher(AttachmentStore(str(tmp_path)))
+        digest = fetcher.fetch(server.url('/a.jpg')).result(5)
+    with open(os.path.join(fetcher.store.temporary_directory, 'interrupted'), 'wb') as leftover:
+        leftover.write(b'partial')
+
+    store = AttachmentStore(str(tmp_path))
+    assert digest in store and store.size == 1000
+    assert os.listdir(store.temporary_directory) == []
+
+
+def test_incoming_attachments_are_prefetched_when_enabled(tmp_path, files, monkeypatch):
+    from web import bot
+
+    with FileServer(files) as server:
+        fetcher = AttachmentFetcher(AttachmentStore(str(tmp_path)))
+        monkeypatch.setitem(bot._clients, 'attachments', fetcher)
+        event = image_message('1001', 1500000000000)
+        event['message']['attachments'][0]['payload']['url'] = server.url('/a.jpg')
+
+        monkeypatch.setattr(bot, 'ATTACHMENTS_PREFETCH', False)
+        bot.process_received_message(FacebookMessage(event))
+        assert fetcher.stats['downloads'] == 0
+
+        monkeypatch.setattr(bot, 'ATTACHMENTS_PREFETCH', True)
+        bot.process_received_message(FacebookMessage(event))
+        with fetcher.open(server.url('/a.jpg'), timeout=5) as content:
+            assert content[:] == files['/a.jpg']
+
+    assert fetcher.stats['downloads'] == 1
+    assert server.hits['/a.jpg'] == 1
@@ -0,0 +1,144 @@
+import json
+import socket
+import threading
+from urllib.parse import parse_qs
+
+import pytest
+import requests
+
+from bench.stubs import StubServer
+from facebook.batch import MessageBatch
+
+
+class StubBatchEndpoint(StubServer):
+    """
+    Graph API batch endpoint answering each request with `answer(index, message)`, or `reply` for the whole batch.
+    """
+
+    def __init__(self, answer=None, reply=None):
+        super().__init__()
+        self.answer = answer or (lambda index, message: {'code': 200, 'body': json.dumps({'message_id': index})})
+        self.reply = reply
+        self.batches = []
+
+    def respond(self, method, url, body):
+        batch = json.loads(body.decode())['batch']
+        messages = [{key: json.loads(values[0]) for key, values in parse_qs(request['body']).items()}
+                    for request in batch]
+        self.batches.append(messages)
+        if self.reply is not None:
+            return self.reply
+        return 200, [self.answer(index, message) for index, message in enumerate(messages)]
+
+
+@pytest.fixture
+def endpoint():
+    with StubBatchEndpoint() as stub:
+        yield stub
+
+
+def message(recipient):
+    return {'recipient': {'id': recipient}, 'message': {'text': 'hi'}}
+
+
+def build_batch(stub, **kwargs):
+    return MessageBatch(requests.Session(), stub.url, 'v2.9/me/messages', **kwargs)
+
+
+def test_flushes_when_full(endpoint):
+    batch = build_batch(endpoint, max_size=3, max_delay=None)
+    items = [batch.add(message(str(n))) for n in range(3)]
+
+    assert all(item.done.is_set() for item in items)
+    assert [[m['recipient']['id'] for m in sent] for sent in endpoint.batches] == [['0', '1', '2']]
+    assert [item.body for item in items] == [{'message_id': 0}, {'message_id': 1}, {'message_id': 2}]
+    assert all(item.ok for item in items)
+
+
+def test_flushes_after_max_delay(endpoint):
+    batch = build_batch(endpoint, max_size=50, max_delay=0.05)
+    item = batch.add(message('1'))
+
+    assert not item.done.is_set()
+    assert item.wait(timeout=2)
+    assert item.status_code == 200
+    assert len(endpoint.batches) == 1
+
+
+def test_close_flushes_the_rest(endpoint):
+    with build_batch(endpoint, max_size=2, max_delay=None) as batch:
+        items = [batch.add(message(str(n))) for n in range(3)]
+
+    assert [len(sent) for sent in endpoint.batches] == [2, 1]
+    assert all(item.ok for item in items)
+
+
+def test_maps_each_response_to_its_item():
+    def answer(index, message):
+        if index == 1:
+            return {'code': 400, 'body': json.dumps({'error': {'message': 'No such user'}})}
+        if index == 2:
+            return None  # Timed out within the batch.
+        return {'code': 200, 'body': json.dumps({'message_id': 'mid.{}'.format(index)})}
+
+    with StubBatchEndpoint(answer) as stub:
+        batch = build_batch(stub, max_delay=None)
+        items = [batch.add(message(str(n))) for n in range(3)]
+        batch.flush()
+
+    assert (items[0].status_code, items[0].body, items[0].error) == (200, {'message_id': 'mid.0'}, None)
+    assert (items[1].status_code, items[1].error) == (400, {'message': 'No such user'})
+    assert not items[1].ok
+    assert items[2].status_code is None and items[2].error
+
+
+def test_short_response_list_resolves_missing_items():
+    with StubBatchEndpoint(reply=(200, [{'code': 200, 'body': '{}'}])) as stub:
+        batch = build_batch(stub, max_delay=None)
+        items = [batch.add(message(str(n))) for n in range(3)]
+        batch.flush()
+
+    assert items[0].ok
+    assert all(item.done.is_set() and item.status_code is None and item.error for item in items[1:])
+
+
+def test_failed_batch_request_resolves_every_item():
+    with StubBatchEndpoint(reply=(500, {'error': {'message': 'Oops'}})) as stub:
+        batch = build_batch(stub, max_delay=None)
+        items = [batch.add(message(str(n))) for n in range(2)]
+        batch.flush()
+
+    assert all(item.status_code == 500 and 'Oops' in item.error for item in items)
+
+
+def test_transport_failure_resolves_every_item():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        closed_port = probe.getsockname()[1]
+
+    batch = MessageBatch(requests.Session(), 'http://127.0.0.1:{}/'.format(closed_port), 'v2.9/me/messages',
+                         max_delay=None)
+    items = [batch.add(message(str(n))) for n in range(2)]
+    batch.flush()
+
+    assert all(item.done.is_set() and item.status_code is None and item.error for item in items)
+
+
+def test_on_result_is_called_for_each_item(endpoint):
+    results = []
+    lock = threading.Lock()
+
+    def on_result(item):
+        with lock:
+            results.append(item)
+
+    batch = build_batch(endpoint, max_size=2, max_delay=None, on_result=on_result)
+    items = [batch.add(message(str(n))) for n in range(3)]
+    batch.close()
+
+    assert sorted(map(id, results)) == sorted(map(id, items))
+
+
+def test_rejects_batches_over_the_graph_limit(endpoint):
+    with pytest.raises(ValueError):
+        build_batch(endpoint, max_size=51)
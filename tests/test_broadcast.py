@@ -0,0 +1,124 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from bench.stubs import StubGraphAPI
+from facebook.broadcast import FileCheckpoint, _Progress
+from facebook.messager import Messager
+
+
+class RecordingGraphAPI(StubGraphAPI):
+    """
+    Send API stand-in recording the recipients, rejecting the ids of `invalid`,
+    and answering the lowest ids the slowest so that sends complete out of order.
+    """
+
+    def __init__(self, invalid=(), slow_below=0):
+        super().__init__()
+        self.invalid = set(invalid)
+        self.slow_below = slow_below
+        self.received = []
+        self._lock = threading.Lock()
+
+    def respond(self, method, url, body):
+        recipient = json.loads(body.decode())['recipient']['id']
+        with self._lock:
+            self.received.append(recipient)
+        if recipient < self.slow_below:
+            time.sleep(0.02)
+        if recipient in self.invalid:
+            return 400, {'error': {'message': 'No matching user found', 'code': 100}}
+        return super().respond(method, url, body)
+
+
+class RecordingCheckpoint(FileCheckpoint):
+    def __init__(self, path, graph):
+        super().__init__(path)
+        self.graph = graph
+        self.saved = []
+        self.ahead_of_sends = []  # Positions saved before all the recipients before them were sent.
+
+    def save(self, position):
+        # Called from the broadcast threads: checked by the test afterwards.
+        if not set(range(position)) <= set(self.graph.received):
+            self.ahead_of_sends.append(position)
+        self.saved.append(position)
+        super().save(position)
+
+
+def messager(graph):
+    return Messager('token', graph_url=graph.url)
+
+
+def test_progress_only_moves_past_contiguous_completions():
+    progress = _Progress(10)
+    assert progress.done(12) == 10
+    assert progress.done(11) == 10
+    assert progress.done(10) == 13
+    assert progress.done(14) == 13
+    assert progress._ahead == {14}
+
+
+def test_broadcast_reports_and_logs_every_recipient():
+    log = io.StringIO()
+    with RecordingGraphAPI(invalid={3, 7}) as graph:
+        report = messager(graph).broadcast(iter(range(50)), {'text': 'Bonjour !'}, concurrency=4, log=log)
+
+    assert sorted(graph.received) == list(range(50))
+    assert (report.sent, report.failed, report.resumed_from) == (48, 2, 0)
+    assert report.statuses == {'200': 48, '400': 2}
+    lines = sorted((line.split('\t') for line in log.getvalue().splitlines()), key=lambda fields: int(fields[0]))
+    assert lines == [[str(n), str(n), '400' if n in (3, 7) else '200'] for n in range(50)]
+
+
+def test_checkpoint_stays_behind_sends_completing_out_of_order(tmp_path):
+    with RecordingGraphAPI(slow_below=20) as graph:
+        checkpoint = RecordingCheckpoint(str(tmp_path / 'checkpoint'), graph)
+        report = messager(graph).broadcast(range(100), {'text': 'Bonjour !'}, concurrency=8,
+                                           checkpoint=checkpoint, checkpoint_every=1)
+
+    assert report.sent == 100
+    assert checkpoint.ahead_of_sends == []
+    assert checkpoint.saved == sorted(checkpoint.saved)
+    # Saved after each completed send: fast recipients completed first, the checkpoint waited for the slow ones.
+    assert any(position < completed for completed, position in enumerate(checkpoint.saved, 1))
+    assert checkpoint.load() == 100
+
+
+def test_interrupted_broadcast_resumes_from_its_checkpoint(tmp_path):
+    path = str(tmp_path / 'checkpoint')
+
+    def interrupted(count, stop_at):
+        for recipient in range(count):
+            if recipient == stop_at:
+                raise KeyboardInterrupt
+            yield recipient
+
+    with RecordingGraphAPI() as graph:
+        checkpoint = RecordingCheckpoint(path, graph)
+        with pytest.raises(KeyboardInterrupt):
+            messager(graph).broadcast(interrupted(300, 120), {'text': 'Bonjour !'}, concurrency=4,
+                                      checkpoint=checkpoint, checkpoint_every=10)
+        first_run = list(graph.received)
+        assert checkpoint.ahead_of_sends == []
+        stopped_at = FileCheckpoint(path).load()
+        assert 0 < stopped_at <= 120
+        assert set(range(stopped_at)) <= set(first_run)
+
+        log = io.StringIO()
+        checkpoint = RecordingCheckpoint(path, graph)
+        report = messager(graph).broadcast(range(300), {'text': 'Bonjour !'}, concurrency=4,
+                                           checkpoint=checkpoint, log=log)
+        second_run = graph.received[len(first_run):]
+        assert checkpoint.ahead_of_sends == []
+
+    assert report.resumed_from == stopped_at
+    assert report.sent == 300 - stopped_at
+    # Only the recipients after the checkpoint are sent again, each once.
+    assert sorted(second_run) == list(range(stopped_at, 300))
+    assert sorted(int(line.split('\t')[0]) for line in log.getvalue().splitlines()) == list(range(stopped_at, 300))
+    assert set(first_run) | set(second_run) == set(range(300))
+    assert FileCheckpoint(path).load() == 300
@@ -0,0 +1,97 @@
+import random
+import threading
+import time
+from collections import defaultdict
+
+from background import routing
+from background.executor import KeyedExecutor
+
+
+def test_calls_of_a_key_run_in_submission_order_under_load():
+    executor = KeyedExecutor(workers=8)
+    done = defaultdict(list)
+    lock = threading.Lock()
+    rng = random.Random(42)
+
+    def work(key, sequence, delay):
+        time.sleep(delay)
+        with lock:
+            done[key].append(sequence)
+
+    # Interleaved submissions for many keys, from several producer threads, with random delays.
+    keys = ['user-{}'.format(n) for n in range(50)]
+    plans = [[(key, rng.uniform(0, 0.002)) for key in rng.sample(keys, len(keys))] for _ in range(20)]
+    submitted = defaultdict(list)
+    submit_lock = threading.Lock()
+    futures = []
+
+    def produce(plan):
+        for key, delay in plan:
+            # A key's sequence number and its submission must be atomic for the order to be known.
+            with submit_lock:
+                sequence = len(submitted[key])
+                submitted[key].append(sequence)
+                futures.append(executor.submit(key, work, key, sequence, delay))
+
+    producers = [threading.Thread(target=produce, args=(plan,)) for plan in plans]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    for future in futures:
+        future.result(timeout=30)
+    executor.shutdown()
+
+    assert set(done) == set(keys)
+    for key in keys:
+        assert done[key] == list(range(20)), key
+
+
+def test_different_keys_run_in_parallel():
+    executor = KeyedExecutor(workers=4)
+    barrier = threading.Barrier(2, timeout=5)
+    other = next(key for key in 'bcdefgh' if routing.shard(key, 4) != routing.shard('a', 4))
+
+    # Both calls wait for each other: this only returns if they run at the same time.
+    futures = [executor.submit(key, barrier.wait) for key in ('a', other)]
+
+    assert all(future.result(timeout=5) is not None for future in futures)
+    executor.shutdown()
+
+
+def test_failed_calls_do_not_stop_their_key():
+    executor = KeyedExecutor(workers=2)
+
+    def fail():
+        raise RuntimeError('boom')
+
+    failed = executor.submit('a', fail)
+    after = executor.submit('a', lambda: 'next')
+
+    assert isinstance(failed.exception(timeout=5), RuntimeError)
+    assert after.result(timeout=5) == 'next'
+    executor.shutdown()
+
+
+def test_shards_are_stable():
+    # crc32 based: the same across processes and runs, unlike hash().
+    assert routing.shard('1234', 4) == 2615402659 % 4
+    assert [routing.conversation_queue('1234', shards=4) for _ in range(3)] == ['conversations.3'] * 3
+    assert routing.conversation_queue(1234, shards=4) == routing.conversation_queue('1234', shards=4)
+
+
+def test_conversations_are_keyed_by_page_and_sender(monkeypatch):
+    monkeypatch.setattr(routing, 'SCOPED_PAGES', frozenset(['7']))
+    assert routing.conversation_key('42') == '42'
+    assert routing.conversation_key('42', page_id='7') == '7:42'
+    assert (routing.conversation_queue('42', shards=16, page_id='7')
+            == routing.CONVERSATION_QUEUE.format(routing.shard('7:42', 16)))
+    assert all(routing.route({'type': 'received', 'sender': '42', 'page': '7'})['queue']
+               == routing.conversation_queue('42', page_id='7') for _ in range(3))
+
+
+def test_conversations_of_the_default_page_keep_their_key():
+    # Pages without a token of their own, e.g. the only one, as before pages were part of the key.
+    assert routing.SCOPED_PAGES == frozenset()
+    assert routing.conversation_key('42', page_id='7') == '42'
+    assert routing.route({'type': 'received', 'sender': '42', 'page': '7'})['queue'] == routing.conversation_queue('42')
@@ -0,0 +1,59 @@
+import pickle
+
+import pytest
+
+from bench.stubs import StubGraphAPI
+from facebook.messager import FacebookEntity, Messager
+
+PROFILE = {
+    'id': '42',
+    'name': 'Ryuzu Maiden',
+    'first_name': 'Ryuzu',
+    'last_name': 'Maiden',
+    'email': 'ryuzu@example.com',
+    'profile_pic': 'https://example.com/ryuzu.png',
+    'locale': 'fr_FR',
+    'timezone': 2,
+    'gender': 'female',
+    'is_payment_enabled': True,
+}
+
+
+class ProfileGraphAPI(StubGraphAPI):
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    def respond(self, method, url, body):
+        if method == 'GET':
+            self.lookups += 1
+            return 200, {'42': PROFILE}
+        return super().respond(method, url, body)
+
+
+def test_hydrates_a_full_profile():
+    entity = FacebookEntity({'id': '42'})
+    entity.hydrate_user_from_api(PROFILE)
+
+    assert (entity.id, entity.first_name, entity.locale, entity.timezone) == ('42', 'Ryuzu', 'fr_FR', 2)
+    # Fields without a slot are kept too.
+    assert entity.name == 'Ryuzu Maiden'
+    assert entity.email == 'ryuzu@example.com'
+    assert entity.extra == {'name': 'Ryuzu Maiden', 'email': 'ryuzu@example.com'}
+    assert entity.last_ad_referral is None
+    with pytest.raises(AttributeError):
+        entity.birthday
+
+    copy = pickle.loads(pickle.dumps(entity))
+    assert (copy.id, copy.first_name, copy.email) == ('42', 'Ryuzu', 'ryuzu@example.com')
+
+
+def test_fetched_users_keep_every_requested_field():
+    with ProfileGraphAPI() as graph:
+        messager = Messager('token', graph_url=graph.url)
+        user = messager.fetch_user('42', fields=['name', 'email', 'first_name'])
+        cached = messager.fetch_user('42', fields=['name', 'email', 'first_name'])
+
+    assert (user.name, user.email, user.first_name) == ('Ryuzu Maiden', 'ryuzu@example.com', 'Ryuzu')
+    assert (cached.name, cached.email) == (user.name, user.email)
+    assert graph.lookups == 1
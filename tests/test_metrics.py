@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('prometheus_client')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter: the multiprocess directory is read when prometheus_client is imported.
+CHILD = '''
+import os, sys
+from web import metrics
+metrics.MESSAGES_DUPLICATED.inc(3)
+metrics.NLP_BREAKER_STATE.set(1)
+body, _ = metrics.render()
+assert b'ryuzu_messages_duplicated_total 3.0' in body, body
+assert os.listdir(sys.argv[1]), 'No metrics written to the multiprocess directory.'
+metrics.mark_process_dead(os.getpid())
+'''
+
+
+@pytest.mark.parametrize('variable', ['PROMETHEUS_MULTIPROC_DIR', 'prometheus_multiproc_dir'])
+def test_multiprocess_mode(tmpdir, variable):
+    env = {key: value for key, value in os.environ.items()
+           if key not in ('PROMETHEUS_MULTIPROC_DIR', 'prometheus_multiproc_dir')}
+    env[variable] = str(tmpdir)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+
+    subprocess.check_call([sys.executable, '-c', CHILD, str(tmpdir)], env=env, cwd=ROOT)
@@ -0,0 +1,97 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from web import metrics
+from web.circuit import CircuitBreaker, CircuitOpen
+from web.nlp import (CachedNLPClient, FakeConversation, FakeNLPClient, NLPReply, NLPTimeout, ResilientNLPClient,
+                     normalize_text)
+
+
+class FailingNLPClient(FakeNLPClient):
+    def converse_text(self, text, conversation_token=None, **kwargs):
+        self.calls.append(text)
+        raise RuntimeError('Provider down')
+
+
+def sample(metric) -> float:
+    return metrics.prometheus_client.REGISTRY.get_sample_value(metric) or 0.0
+
+
+def build(client, failures=2):
+    resilient = ResilientNLPClient(client, ThreadPoolExecutor(2), timeout=1,
+                                   breaker=CircuitBreaker(failure_threshold=failures, reset_timeout=60))
+    return CachedNLPClient(resilient, 'fr')
+
+
+def test_caches_on_normalized_text():
+    provider = FakeNLPClient({'bonjour': 'Salut !'}, intent='greetings')
+    nlp = build(provider)
+
+    assert nlp.converse_text('Bonjour').reply == 'Salut !'
+    assert nlp.converse_text('  BONJOUR !! ').reply == 'Salut !'
+    assert provider.calls == ['Bonjour']
+    assert normalize_text('  Ça   VA ?') == 'ça va'
+
+
+def test_conversations_with_a_token_are_not_served_from_the_cache():
+    class StatefulNLPClient(FakeNLPClient):
+        """Answers from the memory of the conversation, once it knows the name of the user."""
+
+        def __init__(self):
+            super().__init__()
+            self.memory = {}
+
+        def converse_text(self, text, conversation_token=None, **kwargs):
+            self.calls.append(text)
+            if text.startswith('Je suis '):
+                self.memory[conversation_token] = text[len('Je suis '):]
+            name = self.memory.get(conversation_token)
+            return FakeConversation('Bonjour {} !'.format(name) if name else 'Bonjour !', intent='greetings',
+                                    conversation_token=conversation_token or 'new-conversation')
+
+    provider = StatefulNLPClient()
+    nlp = build(provider)
+
+    assert nlp.converse_text('Bonjour').reply == 'Bonjour !'
+    nlp.converse_text('Je suis Alice', conversation_token='alice')
+    reply = nlp.converse_text('Bonjour', conversation_token='alice')
+    assert reply == NLPReply('Bonjour Alice !', 'greetings', 'alice')
+    assert nlp.converse_text('Bonjour', conversation_token='alice').reply == 'Bonjour Alice !'
+    # Stateless calls still share the cache.
+    assert nlp.converse_text('bonjour !') == NLPReply('Bonjour !', 'greetings', None)
+
+    assert provider.calls == ['Bonjour', 'Je suis Alice', 'Bonjour', 'Bonjour']
+    assert (nlp.stats['hits'], nlp.stats['misses'], nlp.stats['stateful']) == (1, 1, 3)
+    assert len(nlp.cache) == 1
+
+
+@pytest.mark.skipif(metrics.prometheus_client is None, reason='Needs prometheus_client.')
+def test_circuit_refusals_are_not_provider_errors():
+    provider = FailingNLPClient()
+    nlp = build(provider, failures=2)
+    errors = sample('ryuzu_nlp_errors_total')
+    latencies = sample('ryuzu_nlp_seconds_count')
+
+    for text in ('a', 'b'):
+        with pytest.raises(RuntimeError):
+            nlp.converse_text(text)
+    for text in ('c', 'd', 'e'):
+        with pytest.raises(CircuitOpen):
+            nlp.converse_text(text)
+
+    assert provider.calls == ['a', 'b']
+    assert sample('ryuzu_nlp_errors_total') - errors == 2
+    assert sample('ryuzu_nlp_seconds_count') - latencies == 2
+
+
+def test_gives_up_after_timeout():
+    class SlowNLPClient(FakeNLPClient):
+        def converse_text(self, text, conversation_token=None, **kwargs):
+            time.sleep(0.5)
+            return super().converse_text(text, conversation_token)
+
+    resilient = ResilientNLPClient(SlowNLPClient(), ThreadPoolExecutor(2), timeout=0.05)
+    with pytest.raises(NLPTimeout):
+        resilient.converse_text('bonjour')
@@ -0,0 +1,61 @@
+import pytest
+
+from bench.stubs import StubGraphAPI
+from facebook.messager import Messager
+from facebook.pages import PageRegistry, UnknownPage
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def graph():
+    with StubGraphAPI() as stub:
+        yield stub
+
+
+def registry(graph, clock, **kwargs):
+    return PageRegistry({'1': 'token-1', '2': 'token-2'}, lambda token: Messager(token, graph_url=graph.url),
+                        clock=clock, **kwargs)
+
+
+def test_each_page_has_its_own_messager(graph):
+    pages = registry(graph, Clock(), default_token='default')
+
+    assert pages.get('1').access_token == 'token-1'
+    assert pages.get('2').access_token == 'token-2'
+    assert pages.get('1') is pages.get('1')
+    # Pages without a token of their own share the default one.
+    assert pages.get('3') is pages.get(None)
+    assert pages.get(None).access_token == 'default'
+    assert pages.stats['created'] == 3
+
+
+def test_unknown_page_without_default_token(graph):
+    with pytest.raises(UnknownPage) as error:
+        registry(graph, Clock()).get('3')
+    assert error.value.args == ('3',)
+
+
+def test_evicted_messagers_stay_usable_by_their_callers(graph):
+    clock = Clock()
+    pages = registry(graph, clock, max_idle=60, max_pages=1)
+    in_use = pages.get('1')  # E.g. by a request still running.
+    closed = []
+    in_use.session.close = lambda: closed.append(in_use)
+
+    pages.get('2')  # Over max_pages.
+    clock.now = 120
+    pages.evict_idle()
+    assert len(pages) == 0
+    assert pages.stats['evictions'] == 2
+    assert closed == []
+
+    response = in_use.send_text('42', 'still there')
+    assert response.status_code == 200
+    assert pages.get('1') is not in_use
@@ -0,0 +1,165 @@
+import gc
+import json
+import time
+import tracemalloc
+
+from bench.fixtures import delivery, read
+from facebook.messager import FacebookMessage
+from facebook.receipts import DELIVERED, READ, WatermarkIndex
+
+
+class StubRedis:
+    """
+    Hashes of watermarks, raised by the script of `WatermarkIndex`; `fail` makes the next pipelines fail.
+    """
+
+    def __init__(self):
+        self.hashes = {}
+        self.fail = False
+
+    def register_script(self, _):
+        def raise_watermarks(keys, args, client):
+            client.calls.append((keys[0], args))
+        return raise_watermarks
+
+    def pipeline(self, transaction=True):
+        return StubPipeline(self)
+
+    def hget(self, key, field):
+        value = self.hashes.get(key, {}).get(str(field))
+        return None if value is None else str(value).encode()
+
+
+class StubPipeline:
+    def __init__(self, redis: StubRedis):
+        self.redis = redis
+        self.calls = []
+
+    def execute(self):
+        if self.redis.fail:
+            raise ConnectionError('Redis is down')
+        for key, args in self.calls:
+            watermarks = self.redis.hashes.setdefault(key, {})
+            for field, watermark in zip(args[::2], args[1::2]):
+                watermarks[str(field)] = max(watermarks.get(str(field), 0), watermark)
+
+
+def receipts(*events):
+    return [FacebookMessage(event) for event in events]
+
+
+def test_watermarks_only_rise():
+    index = WatermarkIndex()
+    index.add(receipts(delivery('1001', 2000), delivery('1001', 1000), read('1001', 1500), read('1001', 500)))
+
+    assert index.watermark(DELIVERED, '1001') == 2000
+    assert index.watermark(READ, '1001') == 1500
+    assert index.has_read('1001', 1500) and not index.has_read('1001', 1501)
+    assert index.has_delivered('1001', 2000) and not index.has_delivered('1001', 2001)
+    assert index.watermark(READ, '1002') is None
+    assert index.stats['collapsed'] == 2
+
+
+def test_read_implies_delivered():
+    index = WatermarkIndex()
+    index.add(receipts(read('1001', 3000)))
+
+    assert index.watermark(DELIVERED, '1001') is None
+    assert index.has_delivered('1001', 3000)
+
+
+def test_numeric_and_other_sender_ids_do_not_collide():
+    index = WatermarkIndex()
+    index.add(receipts(read('1001', 1000), read('01001', 2000), read('user', 3000)))
+
+    assert index.watermark(READ, '1001') == 1000
+    assert index.watermark(READ, '01001') == 2000
+    assert index.watermark(READ, 'user') == 3000
+
+
+def test_local_index_keeps_the_most_recently_updated_senders():
+    index = WatermarkIndex(max_senders=3)
+    index.add(receipts(*[read(str(1000 + n), 5000 + n) for n in range(5)]))
+    index.add(receipts(delivery('1002', 6000)))
+    index.add(receipts(read('1005', 7000)))
+
+    assert len(index) == 3
+    assert index.stats['evictions'] == 3
+    assert [index.watermark(READ, str(sender)) for sender in range(1000, 1006)] == [
+        None, None, 5002, None, 5004, 7000]
+    assert index.watermark(DELIVERED, '1002') == 6000
+
+
+def test_local_index_is_compact():
+    index = WatermarkIndex(max_senders=100000)
+    senders = [str(10 ** 15 + 7919 * n) for n in range(20000)]
+
+    body = json.dumps([event for n, sender in enumerate(senders)
+                       for event in (delivery(sender, 1500000000000 + n), read(sender, 1500000000000 + n))])
+
+    # What the index retains of the parsed receipts, once they are gone.
+    tracemalloc.start()
+    try:
+        index.add(receipts(*json.loads(body)))
+        gc.collect()
+        per_sender = tracemalloc.get_traced_memory()[0] / len(senders)
+    finally:
+        tracemalloc.stop()
+
+    assert len(index) == len(senders)
+    assert per_sender < 200
+
+
+def test_flush_writes_changes_in_batches_and_keeps_them_on_failure():
+    redis = StubRedis()
+    index = WatermarkIndex(redis, batch_size=2, flush_interval=60)
+    index.add(receipts(delivery('1001', 1000), read('1001', 900), delivery('1002', 1100), delivery('1003', 1200)))
+    assert index.pending() == 3
+
+    redis.fail = True
+    index.flush()
+    assert index.pending() == 3
+    assert index.stats['flush_errors'] == 1
+    assert index.watermark(DELIVERED, '1003') == 1200
+
+    redis.fail = False
+    index.flush()
+    assert index.pending() == 0
+    assert redis.hashes == {'receipts:delivered': {'1001': 1000, '1002': 1100, '1003': 1200},
+                            'receipts:read': {'1001': 900}}
+    assert index.stats['flushed'] == 4
+    assert index.watermark(DELIVERED, '1002') == 1100
+    assert index.has_read('1001', 900)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_changes_are_flushed_once_the_interval_elapsed_without_new_receipts():
+    redis = StubRedis()
+    index = WatermarkIndex(redis, flush_size=1000, flush_interval=0.05)
+    index.add(receipts(read('1001', 1000), delivery('1002', 1100)))
+    index.flush_if_due()  # Neither full nor due yet.
+    assert index.pending() == 2
+
+    # No more receipts, hence no more calls: the timer flushes them.
+    wait_for(lambda: index.pending() == 0)
+    assert redis.hashes == {'receipts:delivered': {'1002': 1100}, 'receipts:read': {'1001': 1000}}
+    assert index.stats['flushes'] == 1
+
+
+def test_timed_flush_is_retried_after_a_failure():
+    redis = StubRedis()
+    redis.fail = True
+    index = WatermarkIndex(redis, flush_interval=0.05)
+    index.add(receipts(read('1001', 1000)))
+
+    wait_for(lambda: index.stats['flush_errors'] >= 1)
+    redis.fail = False
+    wait_for(lambda: index.stats['flushes'] == 1)
+    assert redis.hashes == {'receipts:read': {'1001': 1000}}
+    assert index.pending() == 0
@@ -0,0 +1,55 @@
+import pytest
+
+from facebook.messager import FacebookMessage
+from web.router import PrefixTrie, Router
+
+
+def text_message(text):
+    return FacebookMessage({'sender': {'id': '1'}, 'recipient': {'id': '2'}, 'timestamp': 1,
+                            'message': {'mid': 'mid.1', 'text': text}})
+
+
+def postback(payload):
+    return FacebookMessage({'sender': {'id': '1'}, 'recipient': {'id': '2'}, 'timestamp': 1,
+                            'postback': {'payload': payload}})
+
+
+@pytest.fixture
+def router():
+    router = Router()
+    router.keyword('bonjour', prefix=True)(lambda message, messenger: 'greeting')
+    router.keyword('merci')(lambda message, messenger: 'thanks')
+    router.payload('GET_STARTED')(lambda message, messenger: 'started')
+    router.payload('ANSWER_', prefix=True)(lambda message, messenger: 'answer')
+    return router
+
+
+@pytest.mark.parametrize('text', ['bonjour', 'Bonjour !', 'bonjour toi', 'bonjour, toi', 'bonjour!toi',
+                                  'BONJOUR...', "bonjour'toi", 'bonjour-toi'])
+def test_prefix_keywords_end_at_any_word_boundary(router, text):
+    assert router.route(text_message(text))(None, None) == 'greeting'
+
+
+@pytest.mark.parametrize('text', ['bonjourno', 'bonjour2', 'salut bonjour', 'merci beaucoup', 'mercii'])
+def test_keywords_do_not_match_within_words(router, text):
+    assert router.route(text_message(text)) is None
+
+
+def test_exact_keywords_match_whole_texts(router):
+    assert router.route(text_message('Merci !'))(None, None) == 'thanks'
+
+
+def test_payloads(router):
+    assert router.route(postback('GET_STARTED'))(None, None) == 'started'
+    assert router.route(postback('ANSWER_YES'))(None, None) == 'answer'
+    assert router.route(postback('UNKNOWN')) is None
+
+
+def test_longest_prefix_wins():
+    trie = PrefixTrie(word_boundaries=True)
+    trie.add('bon', 'short')
+    trie.add('bon appetit', 'long')
+
+    assert trie.match('bon appetit, merci') == 'long'
+    assert trie.match('bon, appetit') == 'short'
+    assert trie.match('bonne') is None
@@ -0,0 +1,130 @@
+import json
+import os
+import shlex
+
+import pytest
+
+from background import routing, tasks
+from background.app import app as celery
+from background.config.base import BaseCeleryConfig
+from bench.fixtures import delivery, echo, text_message
+from bench.replay import sign
+
+
+@pytest.fixture
+def broker():
+    """
+    Tasks are sent to the in-memory broker of `CeleryTesting` instead of running eagerly.
+    Yields a function returning the names and priorities of the tasks waiting in a queue, and removing them.
+    """
+    assert celery.conf.broker_url == 'memory://'
+    celery.conf.task_always_eager = False
+    with celery.connection_for_write() as connection:
+        def drain(queue: str):
+            waiting = []
+            with connection.SimpleQueue(queue, no_ack=True) as simple:
+                while simple.qsize():
+                    message = simple.get(timeout=1)
+                    waiting.append((message.headers['task'], message.properties.get('priority')))
+            return waiting
+
+        for queue in BaseCeleryConfig.task_queues:
+            drain(queue.name)
+        try:
+            yield drain
+        finally:
+            celery.conf.task_always_eager = True
+
+
+def test_conversations_are_sharded_and_receipts_have_their_own_queue():
+    queues = {routing.route({'type': 'received', 'sender': str(1000000 + n)})['queue'] for n in range(100)}
+    assert queues == {routing.CONVERSATION_QUEUE.format(i) for i in range(routing.CONVERSATION_SHARDS)}
+
+    for kind in ('postback', 'received'):
+        assert not routing.is_bulk(kind)
+        assert routing.route({'type': kind, 'sender': '42'}) == {
+            'queue': routing.conversation_queue('42'), 'priority': routing.CONVERSATION_PRIORITY}
+    for kind in routing.BULK_TYPES:
+        assert routing.is_bulk(kind)
+        assert routing.route({'type': kind, 'sender': '42'}) == {
+            'queue': routing.RECEIPTS_QUEUE, 'priority': routing.RECEIPTS_PRIORITY}
+    assert routing.route_bulk([{'type': 'read', 'sender': '42'}, {'type': 'echo', 'sender': '43'}]) == {
+        'queue': routing.RECEIPTS_QUEUE, 'priority': routing.RECEIPTS_PRIORITY}
+    assert not routing.is_bulk(None)
+
+
+def test_conversations_come_first_and_share_one_priority():
+    # Redis serves lower values first: receipts wait for the conversations of the same worker.
+    assert routing.CONVERSATION_PRIORITY < routing.RECEIPTS_PRIORITY
+    steps = BaseCeleryConfig.broker_transport_options['priority_steps']
+    assert routing.CONVERSATION_PRIORITY in steps and routing.RECEIPTS_PRIORITY in steps
+
+
+def test_queues_are_consumed_round_robin():
+    # A strict order would let `conversations.0` starve the other shards.
+    assert 'queue_order_strategy' not in getattr(BaseCeleryConfig, 'broker_transport_options', {})
+
+
+def test_procfile_runs_one_single_process_worker_per_shard():
+    procfile = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Procfile')
+    consumers = {}
+    with open(procfile) as lines:
+        for line in lines:
+            name, command = line.split(':', 1)
+            args = shlex.split(command)
+            if args[:3] != ['celery', '-A', 'background'] or 'worker' not in args:
+                continue
+            queues = args[args.index('-Q') + 1].split(',')
+            for queue in queues:
+                consumers.setdefault(queue, []).append(name)
+            if any(queue.startswith('conversations.') for queue in queues):
+                assert len(queues) == 1 and args[args.index('-c') + 1] == '1', name
+
+    assert set(consumers) == {queue.name for queue in BaseCeleryConfig.task_queues}
+    assert all(len(names) == 1 for names in consumers.values())
+
+
+def test_tasks_land_on_the_queue_they_are_routed_to(broker):
+    payload = {'type': 'received', 'sender': '1234', 'page': None}
+    tasks.process_received_message.apply_async((payload,), **routing.route(payload))
+    tasks.process_receipts.apply_async(([{'type': 'read', 'sender': '1234'}],),
+                                       **routing.route_bulk([{'type': 'read', 'sender': '1234'}]))
+
+    assert broker(routing.conversation_queue('1234')) == [
+        (tasks.process_received_message.name, routing.CONVERSATION_PRIORITY)]
+    assert broker(routing.RECEIPTS_QUEUE) == [(tasks.process_receipts.name, routing.RECEIPTS_PRIORITY)]
+    assert broker('celery') == []
+
+
+@pytest.mark.parametrize('scoped', [True, False], ids=['page-with-token', 'default-page'])
+def test_webhook_calls_are_dispatched_by_conversation(broker, monkeypatch, scoped):
+    from web.app import FACEBOOK_SECRET, app
+
+    page_id = '2'  # With '1', crc32 happens to give each of these senders the same shard with or without the page.
+    monkeypatch.setattr(routing, 'SCOPED_PAGES', frozenset([page_id] if scoped else []))
+    senders = [str(1000000 + n) for n in range(20)]
+    # Otherwise the page would make no difference to the queues.
+    assert any(routing.shard('{}:{}'.format(page_id, sender), routing.CONVERSATION_SHARDS)
+               != routing.shard(sender, routing.CONVERSATION_SHARDS) for sender in senders)
+
+    start = 1500000000000 if scoped else 1600000000000  # Distinct message ids, not dropped as redeliveries.
+    events = [text_message(sender, start + n) for n, sender in enumerate(senders)]
+    events += [delivery(senders[0], start + 100), echo(senders[1], start + 101)]
+    body = json.dumps({'object': 'page', 'entry': [{'id': page_id, 'time': start, 'messaging': events}]}).encode()
+
+    response = app.test_client().post('/callback', data=body, content_type='application/json',
+                                      headers={'X-Hub-Signature-256': sign(body, FACEBOOK_SECRET)})
+    assert response.status_code == 200
+
+    expected = {}
+    for sender in senders:
+        queue = routing.CONVERSATION_QUEUE.format(
+            routing.shard('{}:{}'.format(page_id, sender) if scoped else sender, routing.CONVERSATION_SHARDS))
+        assert queue == routing.conversation_queue(sender, page_id=page_id)
+        expected[queue] = expected.get(queue, 0) + 1
+    for index in range(routing.CONVERSATION_SHARDS):
+        queue = routing.CONVERSATION_QUEUE.format(index)
+        assert broker(queue) == [(tasks.process_received_message.name, routing.CONVERSATION_PRIORITY)] * expected.get(
+            queue, 0)
+    # Receipts and echoes of the call, in one task.
+    assert broker(routing.RECEIPTS_QUEUE) == [(tasks.process_receipts.name, routing.RECEIPTS_PRIORITY)]
@@ -0,0 +1,64 @@
+import json
+import time
+
+import requests
+
+from bench.stubs import StubServer
+from facebook.messager import Messager
+from facebook.throttling import RetryPolicy
+
+
+def response(status_code, body=None, headers=None):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = json.dumps(body or {}).encode()
+    resp.headers.update(headers or {})
+    return resp
+
+
+def test_rate_limited_retry_honors_a_short_announced_delay():
+    policy = RetryPolicy(base_delay=0.01, max_delay=30)
+    delay = policy.retry_delay(response(429, headers={'Retry-After': '12'}), attempt=0)
+
+    assert delay == 12
+
+
+def test_rate_limited_retry_is_given_up_when_announced_beyond_max_delay():
+    policy = RetryPolicy(max_delay=30)
+    usage = json.dumps({'call_count': 100, 'estimated_time_to_regain_access': 60})
+    limited = response(400, {'error': {'code': 613}}, {'X-App-Usage': usage})
+
+    assert policy.announced_delay(limited) == 3600
+    assert policy.retry_delay(limited, attempt=0) is None
+
+
+def test_transient_errors_back_off_within_max_delay():
+    policy = RetryPolicy(base_delay=1, max_delay=2)
+
+    assert all(0 <= policy.retry_delay(response(503), attempt) <= 2 for attempt in range(10))
+    assert policy.retry_delay(response(400, {'error': {'code': 100}}), attempt=0) is None
+
+
+class LimitedGraphAPI(StubServer):
+    """
+    Rate limits every call, announcing access back in an hour.
+    """
+
+    def respond(self, method, url, body):
+        return 429, {'error': {'code': 613, 'message': 'Calls to this api have exceeded the rate limit.'}}
+
+
+def test_send_does_not_wait_for_a_long_rate_limit():
+    with LimitedGraphAPI() as graph:
+        usage = json.dumps({'estimated_time_to_regain_access': 60})
+        messager = Messager('token', graph_url=graph.url, retry_policy=RetryPolicy(max_delay=0.2))
+        messager.session.hooks['response'].append(
+            lambda resp, *args, **kwargs: resp.headers.update({'X-App-Usage': usage}))
+
+        started = time.monotonic()
+        resp = messager.send_text('1', 'hi')
+
+    assert resp.status_code == 429
+    assert time.monotonic() - started < 1
+    assert graph.stats[429] == 1
+    assert messager.stats['rate_limited'] == 1 and messager.stats['dropped'] == 1
@@ -2,13 +2,23 @@
 import logging.config
 from hmac import compare_digest
 
-import hmac
+import json
+import time
+from typing import List, Tuple
 
-import recastai
+import redis
 from decouple import config
-from flask import Flask, request, json
+from flask import Flask, Response, request, abort
 
+from background import tasks, routing
+from background.executor import KeyedExecutor
+from facebook.dedupe import Deduplicator, SeenSet, RedisSeenSet
 from facebook.messager import Messager, FacebookMessage, FacebookMessageType
+from . import log, metrics, webhook
+from .profiling import RequestProfiler
+from .settings import (FACEBOOK_SECRET, VERIFICATION_TOKEN, DEBUG, ENFORCE_ORIGIN, WEBHOOK_MAX_BODY_SIZE,
+                       DEDUPE_WINDOW, DEDUPE_SIZE, DEDUPE_REDIS_URL, DISPATCH_MODE, DISPATCH_THREADS,
+                       METRICS_TOKEN, PROFILER_DIR, PROFILER_SAMPLE_RATE, PROFILER_SECRET)
 
 
 LOGGING = {
@@ -22,11 +32,18 @@ LOGGING = {
             'format': '[%(levelname)s][%(asctime)s] %(module)s: %(message)s'
         }
     },
+    'filters': {
+        'sampling': {
+            '()': 'web.log.SamplingFilter',
+            'rate': config('LOGGING_SAMPLE_RATE', cast=float, default=1.0),
+        }
+    },
     'handlers': {
         'console': {
             'level': config('CONSOLE_LOGGING_LEVEL', default=logging.INFO),
             'class': 'logging.StreamHandler',
-            'formatter': 'simple'
+            'formatter': 'simple',
+            'filters': ['sampling'],
         }
     },
     'root': {
@@ -45,66 +62,73 @@ LOGGING = {
 }
 
 logging.config.dictConfig(LOGGING)
-
-FACEBOOK_SECRET = config('FACEBOOK_SECRET')
-GREETING_TEXT = config('GREETING_TEXT')
-VERIFICATION_TOKEN = config('FACEBOOK_VERIFICATION_TOKEN')
-ACCESS_TOKEN = config('FACEBOOK_ACCESS_TOKEN')
-DEBUG = config('DEBUG', cast=bool, default=False)
-NLP_LANGUAGE = config('NLP_LANGUAGE', default='fr')
-RECAST_AI_TOKEN = config('RECAST_AI_TOKEN')
-ENFORCE_ORIGIN = config('ENFORCE_ORIGIN', cast=bool, default=(not DEBUG))
+if config('LOGGING_QUEUE', cast=bool, default=True):
+    log.enqueue_handlers(LOGGING['loggers'])
 
 app = Flask(__name__)
-messenger = Messager(ACCESS_TOKEN)
-nlp_client = recastai.Client(RECAST_AI_TOKEN, NLP_LANGUAGE)
 logger = logging.getLogger('web.app')
 
-# Announcing classification: Initial-Y Series 01, "One Who Follows", RyuZU.
-messenger.subscribe_to_page()
-messenger.set_greeting_text(GREETING_TEXT)
+# Page settings are applied once per deploy, by web.bootstrap.
 
+if DEDUPE_REDIS_URL:
+    deduplicator = Deduplicator(RedisSeenSet(redis.StrictRedis.from_url(DEDUPE_REDIS_URL), window=DEDUPE_WINDOW))
+else:
+    deduplicator = Deduplicator(SeenSet(window=DEDUPE_WINDOW, maxsize=DEDUPE_SIZE))
 
-def process_postback_message(message: FacebookMessage):
-    logger.info('Received postback.')
+# Processing happens in Celery workers, see background.tasks.
+dispatchers = {
+    FacebookMessageType.postback: tasks.process_postback_message,
+    FacebookMessageType.received: tasks.process_received_message,
+}
 
+# Or in this process: conversations in parallel, the messages of each one in order.
+executor = KeyedExecutor(DISPATCH_THREADS) if DISPATCH_MODE == 'threads' else None
 
-def process_received_message(message: FacebookMessage):
-    logger.info('Received message: {}'.format(
-        message.text
-    ))
+# Profiles of sampled or requested webhook calls, see web.profiling.
+profiler = RequestProfiler(PROFILER_DIR, PROFILER_SAMPLE_RATE, PROFILER_SECRET, body=lambda: read_body().data)
 
-    response = nlp_client.request.converse_text(message.text)
-    messenger.send_text(message.sender.id, response.reply)
 
+def dispatch(message: FacebookMessage):
+    task = dispatchers[message.type]
+    payload = message.to_payload()
+    if executor is not None:
+        executor.submit(routing.conversation_key(message.sender.id, message.page_id), task, payload)
+    else:
+        task.apply_async((payload,), **routing.route(payload))
 
-dispatchers = {
-    FacebookMessageType.postback: process_postback_message,
-    FacebookMessageType.received: process_received_message,
-}
 
+def dispatch_bulk(messages: List[FacebookMessage]):
+    payloads = [message.to_payload() for message in messages]
+    if executor is not None:
+        executor.submit(routing.RECEIPTS_QUEUE, tasks.process_receipts, payloads)
+    else:
+        tasks.process_receipts.apply_async((payloads,), **routing.route_bulk(payloads))
 
-def assert_origin_from_facebook():
-    signature = request.headers.get('X-Hub-Signature', None)
 
-    if not signature:
+def assert_origin_from_facebook(body: webhook.SignedBody):
+    if not body.signature:
         raise RuntimeError('Invalid origin')
 
-    if not signature.startswith('sha1='):
+    if body.expected is None:
         raise RuntimeError('Malformed signature')
 
-    prefix, sha1_sig = signature.split('=')
-    expected = hmac.new(FACEBOOK_SECRET.encode('ascii'),
-                        request.data,
-                        'sha1').hexdigest()
-
-    if not compare_digest(sha1_sig, expected):
+    if not compare_digest(body.signature, body.expected):
         if DEBUG:
-            raise RuntimeError('Invalid SHA-1 signature, expected: {}, received: {}'.format(
-                expected,
-                sha1_sig))
+            raise RuntimeError('Invalid signature, expected: {}, received: {}'.format(
+                body.expected,
+                body.signature))
         else:
-            raise RuntimeError('Invalid SHA-1 signature')
+            raise RuntimeError('Invalid signature')
+
+
+def read_body() -> webhook.SignedBody:
+    return webhook.read_body(FACEBOOK_SECRET, WEBHOOK_MAX_BODY_SIZE)
+
+
+@app.errorhandler(webhook.BodyTooLarge)
+def body_too_large(error) -> Tuple[str, int]:
+    logger.warning('Rejected webhook call: %s', error)
+    return 'Request body too large', 413
 
 
 @app.route('/callback', methods=["GET"])
@@ -116,32 +140,60 @@ def fb_verify_webhook() -> str:
         return "Wrong verification token!"
 
 
+@app.route('/metrics', methods=["GET"])
+def prometheus_metrics() -> Response:
+    if METRICS_TOKEN and not compare_digest(request.headers.get('Authorization', ''),
+                                            'Bearer {}'.format(METRICS_TOKEN)):
+        abort(403)
+
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
 @app.route('/callback', methods=["POST"])
+@profiler.profiled
 def fb_receive_message_webhook() -> str:
+    started = time.perf_counter()
+    body = read_body()
     try:
         logger.debug('Received a new message.')
         if ENFORCE_ORIGIN:
-            assert_origin_from_facebook()
+            assert_origin_from_facebook(body)
             logger.debug('Verified origin: Facebook')
         else:
             logger.warning('Verification for origin is not enforced!')
 
-        raw_data = request.data.decode()
-        data = json.loads(raw_data)
-        logger.debug('Loaded {} amount of bytes from request.'.format(len(raw_data)))
-        messages = Messager.unserialize_received_request('page', data)
-        logger.debug('Unserialized {} messages.'.format(len(messages)))
+        with metrics.timed(metrics.WEBHOOK_PARSE_LATENCY):
+            data = json.loads(body.data)
+            logger.debug('Loaded %d amount of bytes from request.', len(body.data))
+            messages = Messager.unserialize_received_request('page', data)
+        logger.debug('Unserialized %d messages.', len(messages))
+        unique = deduplicator.filter(messages)
+        if len(unique) != len(messages):
+            metrics.MESSAGES_DUPLICATED.inc(len(messages) - len(unique))
+
+        bulk = []
+        for message in unique:
+            if message.type is not None and routing.is_bulk(message.type.name):
+                # Receipts and echoes of a webhook call are processed together, in the low priority lane.
+                bulk.append(message)
+                metrics.MESSAGES_DISPATCHED.labels(message.type.name).inc()
+                continue
 
-        for message in messages:
             if message.type not in dispatchers:  # Ignore such a message.
-                logger.warning('Ignored message type: {}'.format(message.type))
+                logger.warning('Ignored message type: %s', message.type)
+                metrics.MESSAGES_IGNORED.labels(message.type.name if message.type else 'unknown').inc()
                 continue
 
             # Let's be clear, dispatchers should only enqueue into task queues.
             # No complex and haunting work should be done here.
-            dispatchers[message.type](message)
+            dispatch(message)
+            metrics.MESSAGES_DISPATCHED.labels(message.type.name).inc()
+
+        if bulk:
+            dispatch_bulk(bulk)
 
-        logger.debug('Dispatched all messages through event processors.')
+        logger.debug('Enqueued all messages to event processors.')
     except ValueError:
         logger.exception('While Facebook invoked the receive webhook, an exception occurred, malformed data.')
     except (KeyError, AttributeError):
@@ -149,6 +201,7 @@ def fb_receive_message_webhook() -> str:
     except (RuntimeError, TypeError):
         logger.exception('While Facebook invoked the receive webhook, an exception occurred.')
     finally:
+        metrics.WEBHOOK_LATENCY.observe(time.perf_counter() - started)
         # Don't unsubscribe, Facebook-chan.
         return 'OK'
 
@@ -0,0 +1,98 @@
+"""
+Applies the page settings (webhook subscription, greeting text) once per deploy,
+instead of on every worker boot. They are only sent again when they changed since
+the last successful run, unless `--force` is given.
+
+    python -m web.bootstrap [--force]
+"""
+import argparse
+import hashlib
+import json
+import logging
+from typing import Optional
+
+import redis
+
+from facebook.messager import Messager
+from .bot import get_messenger
+from .settings import ACCESS_TOKEN, GREETING_TEXT, BOOTSTRAP_STATE_FILE, BOOTSTRAP_REDIS_URL
+
+logger = logging.getLogger('web.bootstrap')
+
+
+def page_settings() -> dict:
+    return {'subscribed': True, 'greeting_text': GREETING_TEXT}
+
+
+def fingerprint(settings: dict) -> str:
+    # The access token identifies the page: a new page gets its settings applied.
+    data = json.dumps(settings, sort_keys=True) + ACCESS_TOKEN
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class FileState:
+    def __init__(self, path: str):
+        self.path = path
+
+    def get(self) -> Optional[str]:
+        try:
+            with open(self.path) as state:
+                return state.read().strip() or None
+        except OSError:
+            return None
+
+    def set(self, value: str):
+        with open(self.path, 'w') as state:
+            state.write(value)
+
+
+class RedisState:
+    KEY = 'bootstrap:page-settings'
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def get(self) -> Optional[str]:
+        value = self.redis.get(self.KEY)
+        return value.decode() if value is not None else None
+
+    def set(self, value: str):
+        self.redis.set(self.KEY, value)
+
+
+def build_state():
+    if BOOTSTRAP_REDIS_URL:
+        return RedisState(redis.StrictRedis.from_url(BOOTSTRAP_REDIS_URL))
+    return FileState(BOOTSTRAP_STATE_FILE)
+
+
+def bootstrap(messenger: Messager, state, force: bool = False) -> bool:
+    """
+    Apply the page settings if needed, return whether they were.
+    """
+    settings = page_settings()
+    applied = fingerprint(settings)
+    if not force and state.get() == applied:
+        logger.info('Page settings are up to date.')
+        return False
+
+    # Announcing classification: Initial-Y Series 01, "One Who Follows", RyuZU.
+    for response in (messenger.subscribe_to_page(),
+                     messenger.set_greeting_text(settings['greeting_text'])):
+        response.raise_for_status()
+
+    state.set(applied)
+    logger.info('Applied page settings.')
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--force', action='store_true', help='apply the settings even if unchanged')
+    args = parser.parse_args()
+
+    bootstrap(get_messenger(), build_state(), force=args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import atexit
+import logging
+import threading
+from concurrent.futures import Future
+from typing import List
+
+import recastai.apis.request.utils
+import redis
+
+from facebook.attachments import AttachmentFetcher, AttachmentStore, DOWNLOADABLE_TYPES
+from facebook.cache import TieredCache, TTLCache, RedisCache
+from facebook.messager import Messager, FacebookMessage
+from facebook.pages import PageRegistry
+from facebook.receipts import WatermarkIndex
+from facebook.throttling import RateLimiter
+from . import metrics
+from .circuit import CircuitBreaker, CircuitOpen
+from .nlp import (CachedNLPClient, FakeNLPClient, ResilientNLPClient, SessionRecastClient, build_nlp_cache,
+                  build_nlp_executor)
+from .routes import router
+from .settings import (ACCESS_TOKEN, GRAPH_API_URL, RECAST_AI_TOKEN, NLP_LANGUAGE, NLP_BACKEND,
+                       GRAPH_RATE_LIMIT, GRAPH_RATE_BURST, GRAPH_RECIPIENT_RATE_LIMIT, GRAPH_RECIPIENT_RATE_BURST,
+                       NLP_CACHE_SIZE, NLP_CACHE_TTL, NLP_CACHE_REDIS_URL, NLP_CACHE_EXCLUDED_INTENTS,
+                       PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL, PROFILE_CACHE_REDIS_URL, RECAST_API_URL,
+                       NLP_TIMEOUT, NLP_HEDGE_DELAY, NLP_THREADS, NLP_BREAKER_FAILURES, NLP_BREAKER_RESET,
+                       NLP_FALLBACK_REPLY, RECEIPTS_REDIS_URL, RECEIPTS_FLUSH_SIZE, RECEIPTS_FLUSH_INTERVAL,
+                       RECEIPTS_MAX_SENDERS, ATTACHMENTS_DIR, ATTACHMENTS_MAX_SIZE, ATTACHMENTS_MAX_FILE_SIZE,
+                       ATTACHMENTS_THREADS, ATTACHMENTS_PREFETCH, PAGE_ACCESS_TOKENS, PAGE_IDLE_TIMEOUT,
+                       PAGE_MAX_MESSENGERS, GRAPH_POOL_SIZE)
+
+
+def build_profile_cache() -> TieredCache:
+    shared = None
+    if PROFILE_CACHE_REDIS_URL:
+        shared = RedisCache(redis.StrictRedis.from_url(PROFILE_CACHE_REDIS_URL),
+                            prefix='profile', ttl=PROFILE_CACHE_TTL)
+    return TieredCache(TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL), shared)
+
+
+def build_messenger(access_token: str = ACCESS_TOKEN, profile_cache: TieredCache = None) -> Messager:
+    messenger = Messager(access_token, graph_url=GRAPH_API_URL,
+                         rate_limiter=RateLimiter(GRAPH_RATE_LIMIT, GRAPH_RATE_BURST,
+                                                  GRAPH_RECIPIENT_RATE_LIMIT, GRAPH_RECIPIENT_RATE_BURST),
+                         profile_cache=profile_cache if profile_cache is not None else build_profile_cache(),
+                         pool_size=GRAPH_POOL_SIZE)
+    messenger.session.hooks['response'].append(metrics.observe_graph_response)
+    return messenger
+
+
+def build_pages() -> PageRegistry:
+    # User ids are scoped to their page, the profiles of all pages can share a cache.
+    profile_cache = build_profile_cache()
+    return PageRegistry(PAGE_ACCESS_TOKENS, lambda token: build_messenger(token, profile_cache),
+                        default_token=ACCESS_TOKEN, max_idle=PAGE_IDLE_TIMEOUT, max_pages=PAGE_MAX_MESSENGERS)
+
+
+def on_nlp_breaker_change(state: str):
+    logger.warning('NLP provider circuit is now %s.', state)
+    metrics.observe_breaker_state(state)
+
+
+def build_nlp() -> CachedNLPClient:
+    if RECAST_API_URL:
+        # The Recast client has no option for its endpoint.
+        recastai.apis.request.utils.Utils.CONVERSE_ENDPOINT = RECAST_API_URL + 'v2/converse'
+
+    if NLP_BACKEND == 'fake':
+        nlp_client = FakeNLPClient()
+    else:
+        nlp_client = SessionRecastClient(RECAST_AI_TOKEN, NLP_LANGUAGE, timeout=NLP_TIMEOUT)
+    nlp_client = ResilientNLPClient(nlp_client, build_nlp_executor(NLP_THREADS),
+                                    timeout=NLP_TIMEOUT, hedge_delay=NLP_HEDGE_DELAY,
+                                    breaker=CircuitBreaker(NLP_BREAKER_FAILURES, NLP_BREAKER_RESET,
+                                                           on_change=on_nlp_breaker_change))
+    return CachedNLPClient(nlp_client, NLP_LANGUAGE,
+                           cache=build_nlp_cache(NLP_CACHE_SIZE, NLP_CACHE_TTL, NLP_CACHE_REDIS_URL),
+                           excluded_intents=NLP_CACHE_EXCLUDED_INTENTS)
+
+
+def build_receipts() -> WatermarkIndex:
+    shared = redis.StrictRedis.from_url(RECEIPTS_REDIS_URL) if RECEIPTS_REDIS_URL else None
+    receipts = WatermarkIndex(shared, flush_size=RECEIPTS_FLUSH_SIZE, flush_interval=RECEIPTS_FLUSH_INTERVAL,
+                              max_senders=RECEIPTS_MAX_SENDERS)
+    atexit.register(receipts.flush)
+    return receipts
+
+
+def build_attachments() -> AttachmentFetcher:
+    return AttachmentFetcher(AttachmentStore(ATTACHMENTS_DIR, ATTACHMENTS_MAX_SIZE),
+                             concurrency=ATTACHMENTS_THREADS, max_file_size=ATTACHMENTS_MAX_FILE_SIZE)
+
+
+# Clients are created on first use, so that importing this module stays cheap.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client(name: str, build):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = build()
+    return client
+
+
+def get_messenger(page_id: str = None) -> Messager:
+    """
+    Messager of `page_id`, or of the page of FACEBOOK_ACCESS_TOKEN.
+    """
+    return _client('pages', build_pages).get(page_id)
+
+
+def get_nlp() -> CachedNLPClient:
+    return _client('nlp', build_nlp)
+
+
+def get_receipts() -> WatermarkIndex:
+    return _client('receipts', build_receipts)
+
+
+def get_attachments() -> AttachmentFetcher:
+    return _client('attachments', build_attachments)
+
+
+logger = logging.getLogger('web.bot')
+
+
+def process_postback_message(message: FacebookMessage):
+    logger.info('Received postback.')
+
+    handler = router.route(message)
+    if handler is None:
+        logger.warning('No route for postback payload %s.', message.postback_payload)
+        return
+    handler(message, get_messenger(message.page_id))
+
+
+def process_receipts(messages: List[FacebookMessage]):
+    logger.debug('Received %d receipts and echoes.', len(messages))
+
+    receipts = get_receipts()
+    receipts.add(messages)
+    receipts.flush_if_due()
+
+
+def _log_failed_download(future: Future):
+    if future.exception() is not None:
+        logger.warning('Could not download an attachment: %s', future.exception())
+
+
+def prefetch_attachments(message: FacebookMessage):
+    """
+    Starts downloading the files attached to `message`, handlers then read them with `get_attachments().open(url)`.
+    """
+    fetcher = get_attachments()
+    for attachment in message.attachments:
+        if attachment.type in DOWNLOADABLE_TYPES:
+            fetcher.fetch(attachment.payload).add_done_callback(_log_failed_download)
+
+
+def process_received_message(message: FacebookMessage):
+    logger.info('Received message: %s', message.text, extra={'sampled': True})
+
+    if ATTACHMENTS_PREFETCH and message.attachments:
+        prefetch_attachments(message)
+
+    if message.text is None:  # Attachments only, nothing to understand.
+        return
+
+    handler = router.route(message)
+    if handler is not None:
+        handler(message, get_messenger(message.page_id))
+        return
+
+    try:
+        reply = get_nlp().converse_text(message.text).reply
+    except Exception as exc:
+        logger.warning('NLP provider unavailable, sending the fallback reply.', exc_info=not isinstance(exc, CircuitOpen))
+        metrics.NLP_FALLBACKS.inc()
+        reply = NLP_FALLBACK_REPLY
+
+    get_messenger(message.page_id).send_text(message.sender.id, reply)
@@ -0,0 +1,82 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of calling a dependency which is known to be unhealthy.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency after `failure_threshold` consecutive failures.
+
+    Once open, calls are refused for `reset_timeout` seconds, then a single trial call is let through
+    (half-open): its success closes the circuit, its failure opens it again.
+    `on_change` is called with the new state on every transition.
+    """
+
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 on_change: Optional[Callable[[str], None]] = None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            if self.on_change is not None:
+                self.on_change(state)
+
+    def allow(self) -> bool:
+        """
+        Whether a call may be attempted now; it must then be reported with `record_success` or `record_failure`.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+                self._set_state(self.OPEN)
+
+    def call(self, fn: Callable, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpen('Circuit open for {:.0f} more seconds.'.format(
+                max(0.0, self.reset_timeout - (self.clock() - self._opened_at))))
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
@@ -0,0 +1,61 @@
+"""
+Logging off the request thread.
+
+Records are put on a queue by a `DeferredQueueHandler` and written by a `QueueListener` thread:
+their message is only formatted there, and only if some handler emits them.
+High-volume records are logged with `extra={'sampled': True}`, and only a fraction of them is kept.
+"""
+import atexit
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterable, List
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction `rate` of the records flagged as `sampled`, and all the others.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or not getattr(record, 'sampled', False):
+            return True
+        return random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Enqueues records as they are, `QueueHandler` formats them on the calling thread.
+
+    Arguments are then rendered later, by the listener thread: they should not be mutated after logging.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def enqueue_handlers(logger_names: Iterable[str]) -> QueueListener:
+    """
+    Moves the handlers of these loggers behind a queue, written by a background thread.
+    """
+    loggers = [logging.getLogger(name) for name in logger_names]
+    handlers = []  # type: List[logging.Handler]
+    for logger in loggers:
+        for handler in logger.handlers:
+            if handler not in handlers:
+                handlers.append(handler)
+
+    records = queue.Queue(-1)
+    handler = DeferredQueueHandler(records)
+    for logger in loggers:
+        logger.handlers = [handler]
+
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Flush what is left on exit.
+    return listener
@@ -0,0 +1,120 @@
+"""
+Prometheus metrics of the webhook, the NLP provider and the Graph API.
+
+With several processes (gunicorn workers, Celery workers on the same host), point
+PROMETHEUS_MULTIPROC_DIR of all of them to the same empty directory: `/metrics`
+then aggregates every process. Without prometheus_client, metrics are no-ops.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Tuple
+
+#: Directory shared by the processes in multiprocess mode, None otherwise.
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir') or None
+if MULTIPROC_DIR:
+    # prometheus_client reads it when first imported: before 0.10, only under its lowercase name.
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.environ['prometheus_multiproc_dir'] = MULTIPROC_DIR
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # Optional, metrics are only recorded when installed.
+    prometheus_client = None
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> '_NoopMetric':
+        return self
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def observe(self, amount: float):
+        pass
+
+    def set(self, value: float):
+        pass
+
+
+def _metric(kind: str, name: str, documentation: str, labelnames=(), **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames, **kwargs)
+
+
+LOOKUP_BUCKETS = (.000001, .0000025, .000005, .00001, .000025, .00005, .0001, .001)
+FAST_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1)
+
+WEBHOOK_LATENCY = _metric('Histogram', 'ryuzu_webhook_seconds',
+                          'Time spent handling a webhook call.')
+WEBHOOK_PARSE_LATENCY = _metric('Histogram', 'ryuzu_webhook_parse_seconds',
+                                'Time spent decoding and parsing a webhook body.', buckets=FAST_BUCKETS)
+MESSAGES_DISPATCHED = _metric('Counter', 'ryuzu_messages_dispatched_total',
+                              'Messages handed to their processor.', ['type'])
+MESSAGES_IGNORED = _metric('Counter', 'ryuzu_messages_ignored_total',
+                           'Messages without processor.', ['type'])
+MESSAGES_DUPLICATED = _metric('Counter', 'ryuzu_messages_duplicated_total',
+                              'Messages dropped as redeliveries.')
+NLP_LATENCY = _metric('Histogram', 'ryuzu_nlp_seconds',
+                      'Time spent waiting for the NLP provider.')
+NLP_ERRORS = _metric('Counter', 'ryuzu_nlp_errors_total',
+                     'NLP provider calls which failed.')
+NLP_HEDGES = _metric('Counter', 'ryuzu_nlp_hedged_total',
+                     'NLP provider calls sent twice, the first answer being late.')
+NLP_FALLBACKS = _metric('Counter', 'ryuzu_nlp_fallbacks_total',
+                        'Messages answered with the fallback reply, the NLP provider being unavailable.')
+NLP_BREAKER_STATE = _metric('Gauge', 'ryuzu_nlp_breaker_state',
+                            'Circuit breaker of the NLP provider: 0 closed, 1 half-open, 2 open.',
+                            multiprocess_mode='liveall')
+ROUTER_LOOKUPS = _metric('Counter', 'ryuzu_router_lookups_total',
+                         'Messages looked up in the local routes, by outcome (payload, keyword, unmatched).',
+                         ['outcome'])
+ROUTER_LOOKUP_LATENCY = _metric('Histogram', 'ryuzu_router_lookup_seconds',
+                                'Time spent looking up the local route of a message.', buckets=LOOKUP_BUCKETS)
+GRAPH_API_LATENCY = _metric('Histogram', 'ryuzu_graph_api_seconds',
+                            'Time spent waiting for the Graph API, by status code.', ['status'])
+
+
+@contextmanager
+def timed(histogram):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+
+def observe_graph_response(response, *args, **kwargs):
+    """
+    `requests` response hook, records the latency of Graph API calls.
+    """
+    GRAPH_API_LATENCY.labels(str(response.status_code)).observe(response.elapsed.total_seconds())
+
+
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def observe_breaker_state(state: str):
+    NLP_BREAKER_STATE.set(BREAKER_STATES[state])
+
+
+def render() -> Tuple[bytes, str]:
+    if prometheus_client is None:
+        return b'', 'text/plain'
+
+    if MULTIPROC_DIR:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    else:
+        registry = prometheus_client.REGISTRY
+
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """
+    To be called when a worker process exits, in multiprocess mode.
+    """
+    if prometheus_client is not None and MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
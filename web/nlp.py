@@ -0,0 +1,244 @@
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import Executor, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple, Optional, Iterable, Dict
+
+import redis
+import requests
+from recastai.apis.errors import RecastError
+from recastai.apis.request.models.conversation import Conversation
+from recastai.apis.request.utils import Utils as RecastUtils
+
+from facebook.cache import TTLCache, RedisCache
+from . import metrics
+from .circuit import CircuitBreaker, CircuitOpen
+
+NLPReply = NamedTuple('NLPReply', [
+    ('reply', Optional[str]),
+    ('intent', Optional[str]),
+    ('conversation_token', Optional[str]),
+])
+
+_STRIPPED_CHARACTERS = ' \t\n!?.,;:…'
+
+
+def normalize_text(text: str) -> str:
+    """
+    Folds the variations which do not change the meaning of a sentence for the NLP provider:
+    case, unicode forms, repeated whitespace and trailing punctuation.
+    """
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return ' '.join(text.split()).strip(_STRIPPED_CHARACTERS)
+
+
+def to_reply(response) -> NLPReply:
+    intents = getattr(response, 'intents', None) or []
+    return NLPReply(reply=response.reply,
+                    intent=intents[0].slug if intents else None,
+                    conversation_token=getattr(response, 'conversation_token', None))
+
+
+class CachedNLPClient:
+    """
+    Memoizes the conversation replies of a Recast client.
+
+    Only stateless calls, without a conversation token, are cached: the reply within a conversation
+    depends on its memory, not only on the text. They are keyed on the normalized text and the language.
+    Replies whose intent belongs to `excluded_intents`, or without any reply, are never cached.
+    """
+
+    def __init__(self, client, language: str, cache=None, excluded_intents: Iterable[str] = ()):
+        self.client = client
+        self.language = language
+        self.cache = cache if cache is not None else TTLCache()
+        self.excluded_intents = frozenset(excluded_intents)
+        self.stats = Counter()
+
+    def _key(self, text: str) -> str:
+        return '{}:{}'.format(self.language, normalize_text(text))
+
+    def converse_text(self, text: str, conversation_token: Optional[str] = None) -> NLPReply:
+        if conversation_token is not None:
+            self.stats['stateful'] += 1
+            return self._converse_text(text, conversation_token)
+
+        key = self._key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats['hits'] += 1
+            reply, intent = cached
+            return NLPReply(reply, intent, None)
+
+        self.stats['misses'] += 1
+        reply = self._converse_text(text)
+        if reply.reply is None or reply.intent in self.excluded_intents:
+            self.stats['uncacheable'] += 1
+        else:
+            # Stored as a plain list, so that it can be serialized by shared backends.
+            # The conversation token is left out, it belongs to the conversation which filled the cache.
+            self.cache.set(key, [reply.reply, reply.intent])
+        return reply
+
+    def _converse_text(self, text: str, conversation_token: Optional[str] = None) -> NLPReply:
+        started = time.perf_counter()
+        try:
+            response = self.client.request.converse_text(text, conversation_token=conversation_token)
+        except CircuitOpen:
+            raise  # Refused without calling the provider: neither its error nor its latency.
+        except Exception:
+            metrics.NLP_ERRORS.inc()
+            metrics.NLP_LATENCY.observe(time.perf_counter() - started)
+            raise
+        metrics.NLP_LATENCY.observe(time.perf_counter() - started)
+        return to_reply(response)
+
+
+class NLPTimeout(Exception):
+    pass
+
+
+class ResilientNLPClient:
+    """
+    Bounds the time spent waiting for the NLP provider, whose client has no timeout.
+
+    Calls run on `executor` and are given up after `timeout` seconds: the worker moves on,
+    the stalled call finishes in the background. With `hedge_delay`, a second identical request
+    is sent if the first one did not answer within that delay, and the first answer wins;
+    keep it off for stateful conversations, both requests reach the provider.
+    Failures and timeouts feed `breaker`, which refuses calls while the provider is unhealthy.
+    """
+
+    def __init__(self, client, executor: Executor, timeout: float = 5.0, hedge_delay: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None, clock=time.monotonic):
+        self.client = client
+        self.executor = executor
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.clock = clock
+        self.stats = Counter()
+
+    @property
+    def request(self) -> 'ResilientNLPClient':
+        return self
+
+    def converse_text(self, text: str, conversation_token: Optional[str] = None, **kwargs):
+        return self.breaker.call(self._converse_text, text, conversation_token=conversation_token, **kwargs)
+
+    def _converse_text(self, text: str, **kwargs):
+        started = self.clock()
+        deadline = started + self.timeout
+        pending = {self.executor.submit(self.client.request.converse_text, text, **kwargs)}
+        hedged = not self.hedge_delay
+        error = None
+
+        while pending:
+            now = self.clock()
+            if now >= deadline:
+                break
+            if not hedged and now >= started + self.hedge_delay:
+                hedged = True
+                self.stats['hedged'] += 1
+                metrics.NLP_HEDGES.inc()
+                pending.add(self.executor.submit(self.client.request.converse_text, text, **kwargs))
+
+            wake_up = deadline if hedged else min(deadline, started + self.hedge_delay)
+            done, pending = wait(pending, timeout=wake_up - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as exc:
+                    error = exc
+
+        for future in pending:
+            future.cancel()
+        if pending or error is None:
+            self.stats['timeouts'] += 1
+            raise NLPTimeout('No answer from the NLP provider within {}s.'.format(self.timeout))
+        raise error
+
+
+class SessionRecastClient:
+    """
+    Recast conversation client which keeps its connections open: `recastai` opens one per request.
+
+    Each thread gets its own session, created on first use, so that the client can be shared by
+    the threads of `ResilientNLPClient`. Requests are given up after `timeout` seconds.
+    """
+
+    def __init__(self, token: str, language: str, timeout: Optional[float] = None):
+        self.token = token
+        self.language = language
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def request(self) -> 'SessionRecastClient':
+        return self
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers['Authorization'] = 'Token {}'.format(self.token)
+        return session
+
+    def converse_text(self, text: str, conversation_token: Optional[str] = None, memory=None, **kwargs):
+        body = {'text': text, 'language': self.language}
+        if conversation_token is not None:
+            body['conversation_token'] = conversation_token
+        if memory is not None:
+            body['memory'] = memory
+
+        # Read on every call, web.bot points it to RECAST_API_URL.
+        response = self.session.post(RecastUtils.CONVERSE_ENDPOINT, json=body, timeout=self.timeout)
+        if response.status_code != requests.codes.ok:
+            raise RecastError(response.json().get('message', ''))
+        return Conversation(response, self.token)
+
+
+def build_nlp_executor(threads: int) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=threads, thread_name_prefix='nlp')
+
+
+def build_nlp_cache(size: int, ttl: float, redis_url: Optional[str] = None):
+    if redis_url:
+        return RedisCache(redis.StrictRedis.from_url(redis_url), prefix='nlp', ttl=ttl)
+    return TTLCache(maxsize=size, ttl=ttl)
+
+
+class FakeConversation:
+    def __init__(self, reply: Optional[str], intent: Optional[str] = None, conversation_token: Optional[str] = None):
+        self.reply = reply
+        self.intents = [FakeIntent(intent)] if intent else []
+        self.conversation_token = conversation_token
+
+
+class FakeIntent:
+    def __init__(self, slug: str):
+        self.slug = slug
+
+
+class FakeNLPClient:
+    """
+    Stand-in for `recastai.Client`, answering from a fixed table of normalized texts.
+    Calls are recorded in `calls`, for tests.
+    """
+
+    def __init__(self, replies: Dict[str, str] = None, default_reply: str = '...', intent: Optional[str] = None):
+        self.replies = {normalize_text(text): reply for text, reply in (replies or {}).items()}
+        self.default_reply = default_reply
+        self.intent = intent
+        self.calls = []
+
+    @property
+    def request(self) -> 'FakeNLPClient':
+        return self
+
+    def converse_text(self, text: str, conversation_token: Optional[str] = None, **kwargs) -> FakeConversation:
+        self.calls.append(text)
+        return FakeConversation(self.replies.get(normalize_text(text), self.default_reply),
+                                intent=self.intent, conversation_token=conversation_token)
@@ -0,0 +1,122 @@
+"""
+Opt-in profiling of webhook requests.
+
+A fraction `PROFILER_SAMPLE_RATE` of requests, plus those carrying a valid `X-Profile-Signature`
+header (`sha256=` HMAC of the body with `PROFILER_SECRET`), are run under cProfile.
+Each profile is written to `PROFILER_DIR` as a `.prof` file (pstats format: `python -m pstats`,
+snakeviz, gprof2dot…), next to a `.json` summary of the dispatcher, NLP and Send API phases.
+
+Only the request thread is profiled: with Celery workers or DISPATCH_MODE=threads,
+the NLP and Send API phases happen elsewhere and show up empty.
+"""
+import cProfile
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pstats
+import random
+import time
+from functools import wraps
+from hmac import compare_digest
+from typing import Callable, Dict, Optional
+
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Profile-Signature'
+
+# Phase name: (module path suffix, function names).
+PHASES = {
+    'dispatcher': (os.path.join('web', 'app.py'), ('dispatch',)),
+    'nlp': (os.path.join('web', 'nlp.py'), ('converse_text',)),
+    'send_api': (os.path.join('facebook', 'messager.py'), ('_send',)),
+}
+
+
+def summarize(stats: pstats.Stats) -> Dict[str, Dict[str, float]]:
+    """
+    Calls and cumulative seconds of each phase, slowest first.
+    """
+    phases = {name: {'calls': 0, 'seconds': 0.0} for name in PHASES}
+    for (filename, _, function), (_, calls, _, cumulative, _) in stats.stats.items():
+        for name, (suffix, functions) in PHASES.items():
+            if function in functions and filename.endswith(suffix):
+                phases[name]['calls'] += calls
+                phases[name]['seconds'] += cumulative
+
+    return dict(sorted(phases.items(), key=lambda item: item[1]['seconds'], reverse=True))
+
+
+class RequestProfiler:
+    def __init__(self, directory: str, sample_rate: float = 0.0, secret: Optional[str] = None,
+                 body: Callable[[], bytes] = None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.secret = secret
+        self.body = body or (lambda: request.get_data(cache=True))
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or bool(self.secret)
+
+    def is_requested(self, signature: Optional[str]) -> bool:
+        if not self.secret or not signature:
+            return False
+        body = self.body()
+        expected = 'sha256=' + hmac.new(self.secret.encode('ascii'), body, hashlib.sha256).hexdigest()
+        return compare_digest(signature, expected)
+
+    def should_profile(self) -> bool:
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        return self.is_requested(request.headers.get(SIGNATURE_HEADER))
+
+    def write(self, profile: cProfile.Profile, name: str, elapsed: float) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, '{}-{}-{}'.format(name, int(time.time() * 1000), os.getpid()))
+        profile.dump_stats(path + '.prof')
+
+        summary = {
+            'endpoint': name,
+            'seconds': elapsed,
+            'phases': summarize(pstats.Stats(profile)),
+        }
+        with open(path + '.json', 'w') as output:
+            json.dump(summary, output, indent=2)
+
+        logger.info('Profiled %s in %.1fms, written to %s.prof.', name, elapsed * 1000, path)
+        return path
+
+    def profiled(self, view: Callable) -> Callable:
+        """
+        Decorates a view, so that sampled or requested calls are profiled.
+        """
+        if not self.enabled:
+            return view
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.should_profile():
+                return view(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # Another profiler is running on this interpreter.
+                return view(*args, **kwargs)
+
+            started = time.perf_counter()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                profile.disable()
+                elapsed = time.perf_counter() - started
+                try:
+                    self.write(profile, view.__name__, elapsed)
+                except OSError:
+                    logger.exception('Could not write the profile of %s.', view.__name__)
+
+        return wrapper
@@ -0,0 +1,110 @@
+"""
+Answers what does not need understanding without the NLP provider.
+
+Postback and quick reply payloads are looked up in an exact table, then among payload prefixes;
+free text is matched against keywords by a trie, on its normalized form. Only unmatched text goes to NLP.
+"""
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from facebook.messager import FacebookMessage
+from . import metrics
+from .nlp import normalize_text
+
+Handler = Callable[..., None]
+
+_END = None  # Key of the handler, in the trie nodes.
+
+
+class PrefixTrie:
+    """
+    Finds the longest registered prefix of a string.
+
+    With `word_boundaries`, a prefix only matches when it is followed by the end of the string
+    or a character which is not a letter nor a digit (space, punctuation…).
+    Prefixes registered as `exact` only match whole strings.
+    """
+
+    def __init__(self, word_boundaries: bool = False):
+        self.word_boundaries = word_boundaries
+        self.root = {}  # type: Dict
+
+    def add(self, key: str, value, exact: bool = False):
+        node = self.root
+        for character in key:
+            node = node.setdefault(character, {})
+        node[_END] = (value, exact)
+
+    def match(self, text: str):
+        found = None
+        node = self.root
+        for position, character in enumerate(text):
+            if _END in node and self._matches_at(node[_END], text, position):
+                found = node[_END][0]
+            node = node.get(character)
+            if node is None:
+                return found
+        if _END in node:
+            found = node[_END][0]
+        return found
+
+    def _matches_at(self, entry, text: str, position: int) -> bool:
+        _, exact = entry
+        if exact:
+            return False  # Not the end of the text.
+        return not self.word_boundaries or not text[position].isalnum()
+
+
+class Router:
+    def __init__(self):
+        self.payloads = {}  # type: Dict[str, Handler]
+        self.payload_prefixes = PrefixTrie()
+        self.keywords = PrefixTrie(word_boundaries=True)
+        self.stats = Counter()
+
+    def payload(self, *payloads: str, prefix: bool = False):
+        """
+        Registers the decorated handler for postback and quick reply payloads, or payloads starting with them.
+        """
+        def register(handler: Handler) -> Handler:
+            for payload in payloads:
+                if prefix:
+                    self.payload_prefixes.add(payload, handler)
+                else:
+                    self.payloads[payload] = handler
+            return handler
+        return register
+
+    def keyword(self, *phrases: str, prefix: bool = False):
+        """
+        Registers the decorated handler for texts which are one of `phrases`, or start with one of them.
+        """
+        def register(handler: Handler) -> Handler:
+            for phrase in phrases:
+                self.keywords.add(normalize_text(phrase), handler, exact=not prefix)
+            return handler
+        return register
+
+    def _lookup(self, message: FacebookMessage):
+        payload = message.postback_payload or message.quick_reply_payload
+        if payload is not None:
+            handler = self.payloads.get(payload) or self.payload_prefixes.match(payload)
+            if handler is not None or message.text is None:
+                return handler, 'payload'
+        if message.text:
+            return self.keywords.match(normalize_text(message.text)), 'keyword'
+        return None, None
+
+    def route(self, message: FacebookMessage) -> Optional[Handler]:
+        """
+        Handler of `message`, or None when it has to be understood by the NLP provider.
+        """
+        started = time.perf_counter()
+        handler, kind = self._lookup(message)
+        metrics.ROUTER_LOOKUP_LATENCY.observe(time.perf_counter() - started)
+
+        outcome = kind if handler is not None else 'unmatched'
+        self.stats[outcome] += 1
+        metrics.ROUTER_LOOKUPS.labels(outcome).inc()
+        return handler
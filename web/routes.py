@@ -0,0 +1,40 @@
+"""
+Messages answered locally, see web.router. Handlers are called with the message and the messenger.
+"""
+import json
+from typing import Dict, Optional
+
+from facebook.messager import FacebookMessage, Messager
+from .router import Router
+from .settings import GREETING_TEXT, LOCAL_REPLIES_FILE
+
+router = Router()
+
+
+@router.payload('GET_STARTED')
+def get_started(message: FacebookMessage, messenger: Messager):
+    messenger.send_text(message.sender.id, GREETING_TEXT)
+
+
+def load_replies(path: Optional[str]) -> Dict[str, str]:
+    if not path:
+        return {}
+    with open(path) as replies:
+        return json.load(replies)
+
+
+def add_replies(router: Router, replies: Dict[str, str]):
+    """
+    Answers each phrase with its reply; phrases ending with `*` also match the texts they start.
+    """
+    for phrase, reply in replies.items():
+        def send_reply(message: FacebookMessage, messenger: Messager, reply=reply):
+            messenger.send_text(message.sender.id, reply)
+
+        if phrase.endswith('*'):
+            router.keyword(phrase[:-1], prefix=True)(send_reply)
+        else:
+            router.keyword(phrase)(send_reply)
+
+
+add_replies(router, load_replies(LOCAL_REPLIES_FILE))
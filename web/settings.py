@@ -0,0 +1,56 @@
+from decouple import config, Csv
+
+FACEBOOK_SECRET = config('FACEBOOK_SECRET')
+GREETING_TEXT = config('GREETING_TEXT')
+VERIFICATION_TOKEN = config('FACEBOOK_VERIFICATION_TOKEN')
+ACCESS_TOKEN = config('FACEBOOK_ACCESS_TOKEN')
+PAGE_ACCESS_TOKENS = dict(pair.split(':', 1) for pair in config('PAGE_ACCESS_TOKENS', cast=Csv(), default=''))
+PAGE_IDLE_TIMEOUT = config('PAGE_IDLE_TIMEOUT', cast=float, default=600)
+PAGE_MAX_MESSENGERS = config('PAGE_MAX_MESSENGERS', cast=int, default=64)
+DEBUG = config('DEBUG', cast=bool, default=False)
+NLP_LANGUAGE = config('NLP_LANGUAGE', default='fr')
+RECAST_AI_TOKEN = config('RECAST_AI_TOKEN')
+ENFORCE_ORIGIN = config('ENFORCE_ORIGIN', cast=bool, default=(not DEBUG))
+PROFILE_CACHE_SIZE = config('PROFILE_CACHE_SIZE', cast=int, default=1024)
+PROFILE_CACHE_TTL = config('PROFILE_CACHE_TTL', cast=float, default=3600)
+PROFILE_CACHE_REDIS_URL = config('PROFILE_CACHE_REDIS_URL', default=None)
+NLP_BACKEND = config('NLP_BACKEND', default='recast')
+NLP_CACHE_SIZE = config('NLP_CACHE_SIZE', cast=int, default=4096)
+NLP_CACHE_TTL = config('NLP_CACHE_TTL', cast=float, default=3600)
+NLP_CACHE_REDIS_URL = config('NLP_CACHE_REDIS_URL', default=None)
+NLP_CACHE_EXCLUDED_INTENTS = config('NLP_CACHE_EXCLUDED_INTENTS', cast=Csv(), default='')
+DEDUPE_WINDOW = config('DEDUPE_WINDOW', cast=float, default=600)
+DEDUPE_SIZE = config('DEDUPE_SIZE', cast=int, default=100000)
+DEDUPE_REDIS_URL = config('DEDUPE_REDIS_URL', default=None)
+GRAPH_API_URL = config('GRAPH_API_URL', default=None)
+GRAPH_RATE_LIMIT = config('GRAPH_RATE_LIMIT', cast=float, default=200)
+GRAPH_RATE_BURST = config('GRAPH_RATE_BURST', cast=float, default=200)
+GRAPH_RECIPIENT_RATE_LIMIT = config('GRAPH_RECIPIENT_RATE_LIMIT', cast=float, default=1)
+GRAPH_RECIPIENT_RATE_BURST = config('GRAPH_RECIPIENT_RATE_BURST', cast=float, default=5)
+GRAPH_POOL_SIZE = config('GRAPH_POOL_SIZE', cast=int, default=10)
+RECAST_API_URL = config('RECAST_API_URL', default=None)
+DISPATCH_MODE = config('DISPATCH_MODE', default='celery')
+DISPATCH_THREADS = config('DISPATCH_THREADS', cast=int, default=8)
+BOOTSTRAP_STATE_FILE = config('BOOTSTRAP_STATE_FILE', default='.page-settings')
+BOOTSTRAP_REDIS_URL = config('BOOTSTRAP_REDIS_URL', default=None)
+METRICS_TOKEN = config('METRICS_TOKEN', default=None)
+PROFILER_SAMPLE_RATE = config('PROFILER_SAMPLE_RATE', cast=float, default=0)
+PROFILER_SECRET = config('PROFILER_SECRET', default=None)
+PROFILER_DIR = config('PROFILER_DIR', default='profiles')
+WEBHOOK_MAX_BODY_SIZE = config('WEBHOOK_MAX_BODY_SIZE', cast=int, default=1024 * 1024)
+NLP_TIMEOUT = config('NLP_TIMEOUT', cast=float, default=5)
+NLP_HEDGE_DELAY = config('NLP_HEDGE_DELAY', cast=float, default=0)
+NLP_THREADS = config('NLP_THREADS', cast=int, default=8)
+NLP_BREAKER_FAILURES = config('NLP_BREAKER_FAILURES', cast=int, default=5)
+NLP_BREAKER_RESET = config('NLP_BREAKER_RESET', cast=float, default=30)
+NLP_FALLBACK_REPLY = config('NLP_FALLBACK_REPLY', default='Désolée, je ne peux pas répondre pour le moment.')
+LOCAL_REPLIES_FILE = config('LOCAL_REPLIES_FILE', default=None)
+RECEIPTS_REDIS_URL = config('RECEIPTS_REDIS_URL', default=None)
+RECEIPTS_FLUSH_SIZE = config('RECEIPTS_FLUSH_SIZE', cast=int, default=1000)
+RECEIPTS_FLUSH_INTERVAL = config('RECEIPTS_FLUSH_INTERVAL', cast=float, default=1.0)
+RECEIPTS_MAX_SENDERS = config('RECEIPTS_MAX_SENDERS', cast=int, default=100000)
+ATTACHMENTS_DIR = config('ATTACHMENTS_DIR', default='attachments')
+ATTACHMENTS_MAX_SIZE = config('ATTACHMENTS_MAX_SIZE', cast=int, default=256 * 1024 * 1024)
+ATTACHMENTS_MAX_FILE_SIZE = config('ATTACHMENTS_MAX_FILE_SIZE', cast=int, default=25 * 1024 * 1024)
+ATTACHMENTS_THREADS = config('ATTACHMENTS_THREADS', cast=int, default=4)
+ATTACHMENTS_PREFETCH = config('ATTACHMENTS_PREFETCH', cast=bool, default=False)
@@ -0,0 +1,71 @@
+"""
+Webhook bodies, read in one pass: the signature is computed while the body is read, by chunks,
+and the bytes are handed to the JSON parser as they are.
+"""
+import hashlib
+import hmac
+from typing import NamedTuple, Optional
+
+from flask import g, request
+
+# Preferred first: Facebook sends both.
+SIGNATURE_HEADERS = (
+    ('X-Hub-Signature-256', 'sha256'),
+    ('X-Hub-Signature', 'sha1'),
+)
+CHUNK_SIZE = 16 * 1024
+
+SignedBody = NamedTuple('SignedBody', [
+    ('data', bytearray),
+    ('signature', Optional[str]),  # As received, e.g. `sha256=<hex>`.
+    ('expected', Optional[str]),  # None when the signature is missing or of an unknown kind.
+])
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+def read_signed(stream, headers, content_length: Optional[int], secret: str, max_size: int) -> SignedBody:
+    """
+    Reads at most `max_size` bytes from `stream`, computing the signature announced by `headers` meanwhile.
+    """
+    if content_length is not None and content_length > max_size:
+        raise BodyTooLarge('Body of {} bytes, at most {} are accepted.'.format(content_length, max_size))
+
+    signature, mac = None, None
+    for header, algorithm in SIGNATURE_HEADERS:
+        signature = headers.get(header)
+        if signature:
+            if signature.startswith(algorithm + '='):
+                mac = hmac.new(secret.encode('ascii'), digestmod=getattr(hashlib, algorithm))
+            break
+
+    # Sized upfront when the length is known, so that the buffer is never reallocated and copied.
+    data = bytearray(content_length or 0)
+    size = 0
+    while True:
+        chunk = stream.read(min(CHUNK_SIZE, max_size + 1 - size))
+        if not chunk:
+            break
+        data[size:size + len(chunk)] = chunk
+        size += len(chunk)
+        if size > max_size:
+            raise BodyTooLarge('Body larger than {} bytes.'.format(max_size))
+        if mac is not None:
+            mac.update(chunk)
+    del data[size:]
+
+    expected = '{}={}'.format(algorithm, mac.hexdigest()) if mac is not None else None
+    return SignedBody(data, signature, expected)
+
+
+def read_body(secret: str, max_size: int) -> SignedBody:
+    """
+    Body of the current request, read once and kept for the rest of the request.
+    """
+    body = g.get('webhook_body')
+    if body is None:
+        body = g.webhook_body = read_signed(request.stream, request.headers, request.content_length,
+                                            secret, max_size)
+    return body